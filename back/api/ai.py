@@ -2,10 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import json
+import time
 from datetime import datetime
 
-from .auth import get_current_user
-from ..models.database import User
+from .auth import CurrentUser
 from ..services.ai_service import AIService
 from ..services.context_service import ContextService
 
@@ -43,10 +43,14 @@ class SuggestionResponse(BaseModel):
 ai_service = AIService()
 context_service = ContextService()
 
+# Health checks call Gemini and Qdrant, cache the result briefly for probes/dashboards
+HEALTH_CACHE_TTL = 10
+health_cache = {}
+
 @router.post("/chat-context", response_model=ChatContextResponse)
 async def ai_chat_context(
     request: ChatContextRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """
     AI chat assistant with full context memory and analysis
@@ -90,7 +94,12 @@ async def ai_chat_context(
 async def ai_health():
     """Check AI service health"""
     try:
-        health = await ai_service.health_check()
+        cached = health_cache.get("health")
+        if cached and cached[1] > time.monotonic():
+            health = cached[0]
+        else:
+            health = await ai_service.health_check()
+            health_cache["health"] = (health, time.monotonic() + HEALTH_CACHE_TTL)
         return {
             "status": "healthy",
             "services": health,
@@ -105,7 +114,7 @@ async def ai_health():
 @router.post("/analyze-full-chat")
 async def analyze_full_chat(
     request: ChatContextRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """Analyze and vectorize entire chat history for smart search"""
     try:
@@ -124,6 +133,7 @@ async def analyze_full_chat(
         return {
             "success": True,
             "vectorized_messages": result.get("vectorized_count", 0),
+            "failed_chunks": result.get("failed_count", 0),
             "memory_updated": True
         }
         
@@ -137,7 +147,7 @@ async def analyze_full_chat(
 @router.post("/clear-memory/{chat_id}")
 async def clear_chat_memory(
     chat_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """Clear AI memory for specific chat"""
     try:
@@ -153,7 +163,7 @@ async def clear_chat_memory(
 @router.post("/suggest-response", response_model=SuggestionResponse)
 async def suggest_response(
     request: SuggestionRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """
     Generate AI-powered response suggestions in user's style
@@ -230,8 +240,3 @@ async def suggest_response(
             suggestion="Не удалось сгенерировать предложение",
             error=str(e)
         )
-
-@router.get("/health")
-async def ai_health():
-    """Check AI service health"""
-    return {"status": "healthy", "service": "ai"} 
\ No newline at end of file
@@ -3,7 +3,7 @@ Authentication API Endpoints 🤖
 Cyberpunk User Management System
 """
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Annotated, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
@@ -59,10 +59,10 @@ async def get_current_user(
     token = credentials.credentials
     print(f"🔍 Received token: {token[:20]}..." if token else "🔍 No token received")
     
-    payload = TokenHandler.decode_token(token)
-    print(f"🔍 Token payload: {payload}")
+    token_info = TokenHandler.verify_and_extract(token)
+    print(f"🔍 Token payload: {token_info.payload if token_info else None}")
     
-    if not payload:
+    if not token_info:
         print("🔍 Token decode failed")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -71,31 +71,29 @@ async def get_current_user(
         )
     
     # Check token type
-    if payload.get("type") != "access":
+    if token_info.type != "access":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token type",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    user_id = payload.get("user_id")
-    if not user_id:
+    if not token_info.payload.get("user_id"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token payload",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    try:
-        user_uuid = UUID(user_id)
-    except ValueError:
+    user_uuid = token_info.user_id
+    if user_uuid is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid user ID format",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    user = await get_user_by_id_async(db, str(user_uuid))
+    user = await get_user_by_id_async(db, user_uuid)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -113,6 +111,9 @@ async def get_current_user(
     return user
 
 
+CurrentUser = Annotated[User, Depends(get_current_user)]
+
+
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
@@ -159,7 +160,7 @@ async def register(
         print(f"✅ User validation passed for {user_data.username}")
 
         # 3. Create user in DB
-        hashed_password = TokenHandler.hash_password(user_data.password)
+        hashed_password = await TokenHandler.hash_password_async(user_data.password)
         user_dict = {
             "username": user_data.username.lower(),
             "email": user_data.email,
@@ -169,6 +170,8 @@ async def register(
             "theme_preference": user_data.theme_preference,
             "is_active": True,
             "is_verified": False,
+            # Set here so signup is a single INSERT instead of INSERT + UPDATE
+            "last_login": datetime.now(timezone.utc),
         }
 
         print(f"🔧 Creating user in database: {user_data.username}")
@@ -198,7 +201,6 @@ async def register(
         }
 
         await create_user_session_async(db, session_data)
-        await update_user_last_login_async(db, new_user.id)
 
         print(f"🎉 Registration completed successfully for: {new_user.username}")
 
@@ -238,7 +240,7 @@ async def login(
     """Authenticate user and return tokens"""
     
     user = await get_user_by_email_or_username_async(db, login_data.email_or_username)
-    if not user or not TokenHandler.verify_password(login_data.password, user.hashed_password):
+    if not user or not await TokenHandler.verify_password_async(login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email/username or password",
@@ -326,7 +328,7 @@ async def refresh_token(
 @router.post("/logout", response_model=MessageResponse)
 async def logout(
     refresh_data: RefreshTokenRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Logout user and invalidate session"""
@@ -351,7 +353,7 @@ async def logout(
 
 @router.get("/me", response_model=ProfileResponse, summary="Get current user profile")
 async def get_current_user_profile(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Retrieves the profile of the current authenticated user."""
@@ -398,20 +400,19 @@ async def get_current_user_profile(
 @router.put("/me", response_model=UserResponse)
 async def update_current_user(
     user_update: UserUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user's profile"""
     update_data = user_update.dict(exclude_unset=True)
     
-    updated_user = await db.merge(current_user)
+    # current_user is already loaded in this request's session, no need to merge/refresh it
     for key, value in update_data.items():
-        setattr(updated_user, key, value)
+        setattr(current_user, key, value)
         
     await db.commit()
-    await db.refresh(updated_user)
     
-    return UserResponse.from_orm(updated_user)
+    return UserResponse.from_orm(current_user)
 
 
 
@@ -419,7 +420,7 @@ async def update_current_user(
 
 @router.post("/cleanup-sessions", response_model=MessageResponse)
 async def cleanup_expired_sessions_endpoint(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Clean up expired sessions for all users (admin-only in future)"""
@@ -442,7 +443,7 @@ async def login_for_access_token(
     """Authenticate user and return tokens"""
     
     user = await get_user_by_email_or_username_async(db, login_data.email_or_username)
-    if not user or not TokenHandler.verify_password(login_data.password, user.hashed_password):
+    if not user or not await TokenHandler.verify_password_async(login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email/username or password",
@@ -49,8 +49,8 @@ async def get_dialogs(
     
     # Check cache first
     if cache_key in dialog_cache:
-        cached_data, cache_time = dialog_cache[cache_key]
-        if time.time() - cache_time < CACHE_TTL:
+        cached_data, expires_at = dialog_cache[cache_key]
+        if expires_at > time.monotonic():
             load_time = time.time() - start_time
             logger.info(f"[get_dialogs] Cache hit for session {session_id[:20]}... (load_time: {load_time:.3f}s)")
             return DialogsResponse(
@@ -73,7 +73,7 @@ async def get_dialogs(
         
         if result["success"]:
             # Cache the result
-            dialog_cache[cache_key] = (result["dialogs"], time.time())
+            dialog_cache[cache_key] = (result["dialogs"], time.monotonic() + CACHE_TTL)
             
             # Cleanup old cache entries (keep only last 100)
             if len(dialog_cache) > 100:
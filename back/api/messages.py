@@ -51,8 +51,8 @@ async def get_message_history(
     
     # Check cache first (only for recent messages, not pagination)
     if offset_id == 0 and cache_key in message_cache:
-        cached_data, cache_time = message_cache[cache_key]
-        if time.time() - cache_time < CACHE_TTL:
+        cached_data, expires_at = message_cache[cache_key]
+        if expires_at > time.monotonic():
             load_time = time.time() - start_time
             print(f"💬 [MESSAGES] Cache hit for dialog {dialog_id} (load_time: {load_time:.3f}s)")
             return MessagesResponse(
@@ -75,7 +75,7 @@ async def get_message_history(
     if result["success"]:
         # Cache only recent messages (offset_id == 0)
         if offset_id == 0:
-            message_cache[cache_key] = (result["messages"], time.time())
+            message_cache[cache_key] = (result["messages"], time.monotonic() + CACHE_TTL)
             
             # Cleanup old cache entries (keep only last 50)
             if len(message_cache) > 50:
@@ -1,159 +1,161 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
-from ..database.config import get_db
-from .auth import get_current_user
-from ..models.database import User, PlatformSession
-from sqlalchemy.orm import Session
-import json
+from ..database.config import get_async_db
+from .auth import CurrentUser
+from ..models.database import PlatformSession, upsert_platform_session_async
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+import time
 
 router = APIRouter(tags=["sessions"])
 
+# Short-lived in-process cache for the read endpoints, invalidated on save/delete
+SESSION_CACHE_TTL = 5
+SESSION_CACHE_MAX_SIZE = 10_000
+session_cache = {}
+
+def _cache_get(key):
+    """Return (value, hit) for a non-expired cache entry"""
+    entry = session_cache.get(key)
+    if entry and entry[1] > time.monotonic():
+        return entry[0], True
+    return None, False
+
+def _cache_set(key, value):
+    if len(session_cache) >= SESSION_CACHE_MAX_SIZE:
+        # Drop the oldest inserted entry
+        session_cache.pop(next(iter(session_cache)), None)
+    session_cache[key] = (value, time.monotonic() + SESSION_CACHE_TTL)
+
+def _invalidate_sessions(user_id, platform: str):
+    session_cache.pop(("get", user_id, platform), None)
+    session_cache.pop(("list", user_id), None)
+
 class SessionData(BaseModel):
     platform: str  # "telegram" or "whatsapp"
     session_string: str
     user_id: Optional[int] = None
 
-class SessionResponse(BaseModel):
-    success: bool
-    session_string: Optional[str] = None
-    message: str
-
 @router.post("/save")
 async def save_session(
+    current_user: CurrentUser,
     session_data: SessionData,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Сохранить сессию Telegram или WhatsApp для пользователя"""
-    try:
-        user_id = current_user.id
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Unauthorized")
-        
-        # Проверяем, существует ли уже сессия для этого пользователя и платформы
-        existing_session = db.query(PlatformSession).filter(
-            PlatformSession.user_id == user_id,
-            PlatformSession.platform == session_data.platform
-        ).first()
-        
-        if existing_session:
-            # Обновляем существующую сессию
-            existing_session.session_string = session_data.session_string
-        else:
-            # Создаем новую сессию
-            new_session = PlatformSession(
-                user_id=user_id,
-                platform=session_data.platform,
-                session_string=session_data.session_string
-            )
-            db.add(new_session)
-        
-        db.commit()
-        
-        return SessionResponse(
-            success=True,
-            message=f"Session saved successfully for {session_data.platform}"
-        )
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to save session: {str(e)}")
+    user_id = current_user.id
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    # Создаем или обновляем сессию одним запросом (INSERT ... ON CONFLICT)
+    await upsert_platform_session_async(
+        db,
+        user_id=user_id,
+        platform=session_data.platform,
+        session_string=session_data.session_string
+    )
+    _invalidate_sessions(user_id, session_data.platform)
+    
+    return {
+        "success": True,
+        "message": f"Session saved successfully for {session_data.platform}"
+    }
 
 @router.get("/get/{platform}")
 async def get_session(
     platform: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить сохраненную сессию для пользователя"""
-    try:
-        user_id = current_user.id
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Unauthorized")
-        
-        # Получаем сессию из базы данных
-        session = db.query(PlatformSession).filter(
-            PlatformSession.user_id == user_id,
-            PlatformSession.platform == platform
-        ).first()
-        
-        if not session:
-            return SessionResponse(
-                success=False,
-                message=f"No session found for {platform}"
+    user_id = current_user.id
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    cache_key = ("get", user_id, platform)
+    session_string, hit = _cache_get(cache_key)
+    if not hit:
+        # Получаем только строку сессии, без загрузки ORM-объекта
+        session_string = await db.scalar(
+            select(PlatformSession.session_string).where(
+                PlatformSession.user_id == user_id,
+                PlatformSession.platform == platform
             )
-        
-        return SessionResponse(
-            success=True,
-            session_string=session.session_string,
-            message=f"Session retrieved successfully for {platform}"
         )
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get session: {str(e)}")
+        _cache_set(cache_key, session_string)
+    
+    if session_string is None:
+        return {
+            "success": False,
+            "message": f"No session found for {platform}"
+        }
+    
+    return {
+        "success": True,
+        "session_string": session_string,
+        "message": f"Session retrieved successfully for {platform}"
+    }
 
 @router.delete("/delete/{platform}")
 async def delete_session(
     platform: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Удалить сохраненную сессию для пользователя"""
-    try:
-        user_id = current_user.id
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Unauthorized")
-        
-        # Удаляем сессию из базы данных
-        session = db.query(PlatformSession).filter(
+    user_id = current_user.id
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    # Удаляем сессию одним DELETE, rowcount показывает была ли она
+    result = await db.execute(
+        delete(PlatformSession).where(
             PlatformSession.user_id == user_id,
             PlatformSession.platform == platform
-        ).first()
-        
-        if not session:
-            return SessionResponse(
-                success=False,
-                message=f"No session found to delete for {platform}"
-            )
-        
-        db.delete(session)
-        db.commit()
-        
-        return SessionResponse(
-            success=True,
-            message=f"Session deleted successfully for {platform}"
         )
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to delete session: {str(e)}")
+    )
+    await db.commit()
+    _invalidate_sessions(user_id, platform)
+    
+    if result.rowcount == 0:
+        return {
+            "success": False,
+            "message": f"No session found to delete for {platform}"
+        }
+    
+    return {
+        "success": True,
+        "message": f"Session deleted successfully for {platform}"
+    }
 
 @router.get("/list")
 async def list_sessions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получить список всех сохраненных сессий пользователя"""
-    try:
-        user_id = current_user.id
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Unauthorized")
-        
-        # Получаем все сессии пользователя
-        sessions = db.query(PlatformSession).filter(PlatformSession.user_id == user_id).all()
-        
-        return {
-            "success": True,
-            "sessions": [
-                {
-                    "platform": session.platform,
-                    "created_at": session.created_at.isoformat() if session.created_at else None,
-                    "updated_at": session.updated_at.isoformat() if session.updated_at else None
-                }
-                for session in sessions
-            ]
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to list sessions: {str(e)}") 
\ No newline at end of file
+    user_id = current_user.id
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    cache_key = ("list", user_id)
+    sessions_data, hit = _cache_get(cache_key)
+    if not hit:
+        # Только нужные колонки, без ORM-объектов; datetime сериализует orjson (ISO 8601)
+        result = await db.execute(
+            select(
+                PlatformSession.platform,
+                PlatformSession.created_at,
+                PlatformSession.updated_at
+            ).where(PlatformSession.user_id == user_id)
+        )
+        sessions_data = [row._asdict() for row in result]
+        _cache_set(cache_key, sessions_data)
+    
+    # Ответ уже из простых типов — отдаем напрямую, минуя jsonable_encoder
+    return ORJSONResponse({
+        "success": True,
+        "sessions": sessions_data
+    })
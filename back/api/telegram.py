@@ -1,6 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from back.models.database import User
-from back.api.auth import get_current_user
+from back.api.auth import CurrentUser
 from pydantic import BaseModel
 from back.globals import get_telegram_manager
 
@@ -9,23 +8,34 @@ router = APIRouter(tags=["Telegram"])
 class ConnectRequest(BaseModel):
     session_string: str
 
+# Telegram being slow or unreachable isn't the client's fault; only a rejected session is a 400
+RESTORE_ERROR_STATUS = {
+    "timeout": (status.HTTP_504_GATEWAY_TIMEOUT, "Telegram did not respond in time"),
+    "unavailable": (status.HTTP_502_BAD_GATEWAY, "Could not reach Telegram"),
+    "flood_wait": (status.HTTP_503_SERVICE_UNAVAILABLE, "Telegram rate limit reached, try again later"),
+}
+
+
+def raise_restore_error(user_info: dict):
+    """Map a failed restore_session_and_get_user_info result to an HTTP error"""
+    status_code, detail = RESTORE_ERROR_STATUS.get(
+        user_info.get("error_type"), (status.HTTP_400_BAD_REQUEST, "Invalid session string")
+    )
+    headers = {"Retry-After": str(user_info["retry_after"])} if "retry_after" in user_info else None
+    raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+
 @router.post("/connect", status_code=status.HTTP_200_OK)
 async def connect_telegram(
+    current_user: CurrentUser,
     request: ConnectRequest,
-    current_user: User = Depends(get_current_user),
     manager = Depends(get_telegram_manager)
 ):
     """Validate Telegram session string and mark user as connected"""
     
-    # Validate and restore session
-    result = await manager.restore_session(request.session_string, f"user_{current_user.id}_connect")
-    if not result["success"]:
-        raise HTTPException(status_code=400, detail="Invalid session string")
-    
-    # Get user info to verify session is valid
-    user_info = await manager.get_user_info(request.session_string)  # Use session_string directly
+    # Validate and restore session, fetching user info in the same call
+    user_info = await manager.restore_session_and_get_user_info(request.session_string, f"user_{current_user.id}_connect")
     if not user_info["success"]:
-        raise HTTPException(status_code=500, detail="Could not get user info from Telegram")
+        raise_restore_error(user_info)
     
     # Don't clean up the session - keep it for API calls
     # Session is now stored under session_string for later use
@@ -34,34 +44,29 @@ async def connect_telegram(
         "message": "Telegram connected successfully",
         "telegram_user_id": user_info["id"],
         "telegram_username": user_info["username"],
-        "telegram_display_name": f"{user_info['first_name'] or ''} {user_info['last_name'] or ''}".strip(),
+        "telegram_display_name": user_info["display_name"],
         "phone_number": user_info["phone"]
     }
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
 async def logout_telegram(
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """Logout from Telegram (frontend handles session cleanup)"""
     return {"message": "Telegram disconnected successfully"}
 
 @router.post("/restore-session", status_code=status.HTTP_200_OK)
 async def restore_telegram_session(
+    current_user: CurrentUser,
     request: ConnectRequest,
-    current_user: User = Depends(get_current_user),
     manager = Depends(get_telegram_manager)
 ):
     """Validate and restore Telegram session from frontend"""
     
-    # Validate and restore session
-    result = await manager.restore_session(request.session_string, f"user_{current_user.id}_restore")
-    if not result["success"]:
-        raise HTTPException(status_code=400, detail="Invalid session string")
-    
-    # Get user info to verify session is valid
-    user_info = await manager.get_user_info(request.session_string)  # Use session_string directly
+    # Validate and restore session, fetching user info in the same call
+    user_info = await manager.restore_session_and_get_user_info(request.session_string, f"user_{current_user.id}_restore")
     if not user_info["success"]:
-        raise HTTPException(status_code=500, detail="Could not get user info from Telegram")
+        raise_restore_error(user_info)
     
     # Don't clean up the session - keep it for API calls
     # Session is now stored under session_string for later use
@@ -70,6 +75,6 @@ async def restore_telegram_session(
         "message": "Telegram session restored successfully",
         "telegram_user_id": user_info["id"],
         "telegram_username": user_info["username"],
-        "telegram_display_name": f"{user_info['first_name'] or ''} {user_info['last_name'] or ''}".strip(),
+        "telegram_display_name": user_info["display_name"],
         "phone_number": user_info["phone"]
     } 
\ No newline at end of file
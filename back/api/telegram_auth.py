@@ -1,11 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-import uuid
+import secrets
+import logging
 from back.globals import get_telegram_manager
 from back.telegram.telegram_client import TelegramClientManager
 
 # New router for Telegram authentication
 telegram_auth_router = APIRouter(tags=["Telegram Authentication"])
+logger = logging.getLogger("chathut.telegram_auth")
 
 class PhoneRequest(BaseModel):
     phone: str
@@ -29,23 +31,20 @@ async def send_code(
     manager: TelegramClientManager = Depends(get_telegram_manager)
 ):
     """Initiates Telegram login by sending a code to the user's phone."""
-    session_id = str(uuid.uuid4())
-    print(f"[TELEGRAM_AUTH] Trying to send code to phone: {request.phone}, session_id: {session_id}")
-    try:
-        result = await manager.authenticate_with_phone(request.phone, session_id)
-        print(f"[TELEGRAM_AUTH] Telegram send_code result: {result}")
-        if result["success"]:
-            return {
-                "success": True, 
-                "session_id": session_id, 
-                "phone_code_hash": result["phone_code_hash"]
-            }
-        else:
-            print(f"[TELEGRAM_AUTH] Error from Telegram: {result.get('error')}")
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to send code"))
-    except Exception as e:
-        print(f"[TELEGRAM_AUTH] Exception in send_code: {e}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    session_id = secrets.token_hex(16)
+    logger.info("Trying to send code, session_id: %s", session_id)
+    result = await manager.authenticate_with_phone(request.phone, session_id)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Telegram send_code result: %s", result)
+    if result["success"]:
+        return {
+            "success": True, 
+            "session_id": session_id, 
+            "phone_code_hash": result["phone_code_hash"]
+        }
+    else:
+        logger.warning("Error from Telegram: %s", result.get("error"))
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to send code"))
 
 @telegram_auth_router.post("/verify-code")
 async def verify_code(
@@ -53,25 +52,22 @@ async def verify_code(
     manager: TelegramClientManager = Depends(get_telegram_manager)
 ):
     """Verifies the authentication code and logs the user in."""
-    try:
-        result = await manager.verify_phone_code(
-            session_id=request.session_id,
-            phone=request.phone,
-            phone_code_hash=request.phone_code_hash,
-            code=request.code
-        )
-        if result.get("success"):
-            return {
-                "success": True,
-                "session_id": request.session_id,
-                "session_string": result["session_string"],
-            }
-        elif result.get("need_password"):
-             return {"success": False, "need_password": True}
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Invalid code"))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    result = await manager.verify_phone_code(
+        session_id=request.session_id,
+        phone=request.phone,
+        phone_code_hash=request.phone_code_hash,
+        code=request.code
+    )
+    if result.get("success"):
+        return {
+            "success": True,
+            "session_id": request.session_id,
+            "session_string": result["session_string"],
+        }
+    elif result.get("need_password"):
+        return {"success": False, "need_password": True}
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Invalid code"))
 
 @telegram_auth_router.post("/verify-password")
 async def verify_password(
@@ -79,21 +75,18 @@ async def verify_password(
     manager: TelegramClientManager = Depends(get_telegram_manager)
 ):
     """Verifies the 2FA password."""
-    try:
-        result = await manager.verify_2fa_password(
-            session_id=request.session_id,
-            password=request.password
-        )
-        if result["success"]:
-            return {
-                "success": True,
-                "session_id": request.session_id,
-                "session_string": result["session_string"],
-            }
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Invalid password"))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    result = await manager.verify_2fa_password(
+        session_id=request.session_id,
+        password=request.password
+    )
+    if result["success"]:
+        return {
+            "success": True,
+            "session_id": request.session_id,
+            "session_string": result["session_string"],
+        }
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Invalid password"))
 
 @telegram_auth_router.post("/restore-session")
 async def restore_session(
@@ -101,12 +94,9 @@ async def restore_session(
     manager: TelegramClientManager = Depends(get_telegram_manager)
 ):
     """Restores a Telegram session from a session string."""
-    session_id = str(uuid.uuid4())
-    try:
-        result = await manager.restore_session(request.session_string, session_id)
-        if result["success"]:
-            return {"success": True, "session_id": session_id}
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to restore session"))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}") 
\ No newline at end of file
+    session_id = secrets.token_hex(16)
+    result = await manager.restore_session(request.session_string, session_id)
+    if result["success"]:
+        return {"success": True, "session_id": session_id}
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to restore session"))
@@ -1,172 +1,148 @@
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends
 from typing import Optional
-import json
+import orjson
+import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..whatsapp.whatsapp_client import WhatsAppClientManager
-from back.models.database import User
 from back.database.config import get_async_db
 from ..auth import jwt_handler
-from back.api.auth import get_current_user
+from back.api.auth import CurrentUser
 
 router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
+logger = logging.getLogger("chathut.whatsapp")
+
+# Pre-encoded control frame (clients parse text frames, so keep it a str)
+PONG_FRAME = orjson.dumps({"type": "pong"}).decode()
 
 # Global WhatsApp client manager
 whatsapp_manager = WhatsAppClientManager()
 
 @router.post("/connect")
 async def connect_whatsapp(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Connect to WhatsApp Web"""
-    try:
-        session_id = f"whatsapp_{current_user.id}"
-        result = await whatsapp_manager.create_session(session_id)
+    session_id = f"whatsapp_{current_user.id}"
+    result = await whatsapp_manager.create_session(session_id)
+    
+    if result.get("success"):
+        # Update user's WhatsApp connection status
+        current_user.is_whatsapp_connected = True
+        await db.commit()
         
-        if result.get("success"):
-            # Update user's WhatsApp connection status
-            current_user.is_whatsapp_connected = True
-            await db.commit()
-            
-            return {
-                "success": True,
-                "sessionId": session_id,
-                "message": "WhatsApp session created successfully"
-            }
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to connect"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return {
+            "success": True,
+            "sessionId": session_id,
+            "message": "WhatsApp session created successfully"
+        }
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to connect"))
 
 @router.post("/disconnect")
 async def disconnect_whatsapp(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Disconnect from WhatsApp Web"""
-    try:
-        session_id = f"whatsapp_{current_user.id}"
-        result = await whatsapp_manager.disconnect_session(session_id)
+    session_id = f"whatsapp_{current_user.id}"
+    result = await whatsapp_manager.disconnect_session(session_id)
+    
+    if result.get("success"):
+        # Update user's WhatsApp connection status
+        current_user.is_whatsapp_connected = False
+        await db.commit()
         
-        if result.get("success"):
-            # Update user's WhatsApp connection status
-            current_user.is_whatsapp_connected = False
-            await db.commit()
-            
-            return {
-                "success": True,
-                "message": "WhatsApp session disconnected successfully"
-            }
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to disconnect"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return {
+            "success": True,
+            "message": "WhatsApp session disconnected successfully"
+        }
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to disconnect"))
 
 @router.get("/chats")
-async def get_whatsapp_chats(current_user: User = Depends(get_current_user)):
+async def get_whatsapp_chats(current_user: CurrentUser):
     """Get list of WhatsApp chats"""
-    try:
-        session_id = f"whatsapp_{current_user.id}"
-        
-        if not whatsapp_manager.is_session_active(session_id):
-            raise HTTPException(status_code=400, detail="WhatsApp session not active")
-        
-        result = await whatsapp_manager.get_chats(session_id)
-        
-        if result.get("success"):
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to get chats"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    session_id = f"whatsapp_{current_user.id}"
+    
+    if not whatsapp_manager.is_session_active(session_id):
+        raise HTTPException(status_code=400, detail="WhatsApp session not active")
+    
+    result = await whatsapp_manager.get_chats(session_id)
+    
+    if result.get("success"):
+        return result
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to get chats"))
 
 @router.get("/messages")
 async def get_whatsapp_messages(
     chat_id: str,
-    limit: int = 50,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser,
+    limit: int = 50
 ):
     """Get messages from a WhatsApp chat"""
-    try:
-        session_id = f"whatsapp_{current_user.id}"
-        
-        if not whatsapp_manager.is_session_active(session_id):
-            raise HTTPException(status_code=400, detail="WhatsApp session not active")
-        
-        result = await whatsapp_manager.get_messages(session_id, chat_id, limit)
-        
-        if result.get("success"):
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to get messages"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    session_id = f"whatsapp_{current_user.id}"
+    
+    if not whatsapp_manager.is_session_active(session_id):
+        raise HTTPException(status_code=400, detail="WhatsApp session not active")
+    
+    result = await whatsapp_manager.get_messages(session_id, chat_id, limit)
+    
+    if result.get("success"):
+        return result
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to get messages"))
 
 @router.post("/send")
 async def send_whatsapp_message(
     chat_id: str,
     text: str,
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser
 ):
     """Send a message to a WhatsApp chat"""
-    try:
-        session_id = f"whatsapp_{current_user.id}"
-        
-        if not whatsapp_manager.is_session_active(session_id):
-            raise HTTPException(status_code=400, detail="WhatsApp session not active")
-        
-        result = await whatsapp_manager.send_message(session_id, chat_id, text)
-        
-        if result.get("success"):
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to send message"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    session_id = f"whatsapp_{current_user.id}"
+    
+    if not whatsapp_manager.is_session_active(session_id):
+        raise HTTPException(status_code=400, detail="WhatsApp session not active")
+    
+    result = await whatsapp_manager.send_message(session_id, chat_id, text)
+    
+    if result.get("success"):
+        return result
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to send message"))
 
 @router.post("/clear-sessions")
 async def clear_whatsapp_sessions(
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser,
     db: AsyncSession = Depends(get_async_db)
 ):
     """Clear all WhatsApp sessions for the current user"""
-    try:
-        result = await whatsapp_manager.clear_user_sessions(current_user.id)
+    result = await whatsapp_manager.clear_user_sessions(current_user.id)
+    
+    if result.get("success"):
+        # Update user's WhatsApp connection status
+        current_user.is_whatsapp_connected = False
+        await db.commit()
         
-        if result.get("success"):
-            # Update user's WhatsApp connection status
-            current_user.is_whatsapp_connected = False
-            await db.commit()
-            
-            return {
-                "success": True,
-                "message": f"Cleared {result.get('clearedSessions', 0)} WhatsApp sessions"
-            }
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to clear sessions"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return {
+            "success": True,
+            "message": f"Cleared {result.get('clearedSessions', 0)} WhatsApp sessions"
+        }
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to clear sessions"))
 
 @router.get("/status")
-async def get_whatsapp_status(current_user: User = Depends(get_current_user)):
+async def get_whatsapp_status(current_user: CurrentUser):
     """Get WhatsApp session status"""
-    try:
-        session_id = f"whatsapp_{current_user.id}"
-        result = await whatsapp_manager.get_session_status(session_id)
-        
-        if result.get("success"):
-            return result
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Failed to get status"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    session_id = f"whatsapp_{current_user.id}"
+    result = await whatsapp_manager.get_session_status(session_id)
+    
+    if result.get("success"):
+        return result
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Failed to get status"))
 
 @router.websocket("/ws/{session_id}")
 async def whatsapp_websocket(websocket: WebSocket, session_id: str):
@@ -182,20 +158,20 @@ async def whatsapp_websocket(websocket: WebSocket, session_id: str):
             try:
                 # Wait for any message from client (ping/pong)
                 data = await websocket.receive_text()
-                message = json.loads(data)
+                message = orjson.loads(data)
                 
                 # Handle client messages if needed
                 if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
+                    await websocket.send_text(PONG_FRAME)
                     
             except WebSocketDisconnect:
                 break
             except Exception as e:
-                print(f"WebSocket error: {e}")
+                logger.warning("WebSocket error: %s", e)
                 break
                 
     except Exception as e:
-        print(f"WebSocket connection error: {e}")
+        logger.warning("WebSocket connection error: %s", e)
     finally:
         # Clean up websocket connection
         await whatsapp_manager.remove_websocket(session_id, websocket) 
\ No newline at end of file
@@ -2,17 +2,23 @@
 JWT Token Handler 🤖
 Cyberpunk Authentication Security
 """
+import asyncio
+import base64
+import hmac
 import os
+import re
 import hashlib
-from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+import secrets
+import time
+from functools import lru_cache
+from datetime import timedelta
+from typing import Optional, Dict, Any, NamedTuple, Union
 from uuid import UUID
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from passlib.hash import bcrypt
-from dotenv import load_dotenv
+import orjson
+import bcrypt
+from back.utils.env import load_env
 
-load_dotenv()
+load_env()
 
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "chathut_cyberpunk_secret_key_2024_neural_matrix")
@@ -20,8 +26,65 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 30
 
+# Token lifetimes in seconds (JWT exp is a unix timestamp)
+_ACCESS_DELTA_S = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+_REFRESH_DELTA_S = REFRESH_TOKEN_EXPIRE_DAYS * 86400
+_RESET_DELTA_S = 3600
+_VERIFY_DELTA_S = 86400
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = 12
+
+
+def _bcrypt_hash(password: str) -> str:
+    # bcrypt only uses the first 72 bytes of the password
+    return bcrypt.hashpw(password.encode("utf-8")[:72], bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+
+
+def _bcrypt_verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode("utf-8")[:72], hashed_password.encode())
+
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+# ALGORITHM and SECRET_KEY are fixed, so the header and keyed HMAC state are built once
+_HEADER_B64 = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+_HMAC_TEMPLATE = hmac.new(SECRET_KEY.encode(), digestmod=hashlib.sha256)
+
+
+def _encode_jwt(claims: Dict[str, Any]) -> str:
+    """HS256-sign claims; produces the same tokens jose.jwt.encode would"""
+    signing_input = _HEADER_B64 + b"." + _b64url(orjson.dumps(claims))
+    mac = _HMAC_TEMPLATE.copy()
+    mac.update(signing_input)
+    return (signing_input + b"." + _b64url(mac.digest())).decode()
+
+
+@lru_cache(maxsize=1)
+def _jose():
+    """Import jose on first decode; issuing tokens doesn't need it"""
+    from jose import jwt, JWTError
+    return jwt, JWTError
+
+
+@lru_cache(maxsize=4096)
+def _decode_cached(token: str) -> Optional[Dict[str, Any]]:
+    """Verify a token once; later calls with the same token are a dict lookup"""
+    jwt, JWTError = _jose()
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+class TokenInfo(NamedTuple):
+    """Everything callers need from one verified token"""
+    user_id: Optional[UUID]
+    exp: int
+    type: Optional[str]
+    payload: Dict[str, Any]
 
 
 class TokenHandler:
@@ -30,38 +93,42 @@ class TokenHandler:
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash password using bcrypt"""
-        return pwd_context.hash(password)
+        return _bcrypt_hash(password)
     
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
         """Verify password against hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        return _bcrypt_verify(plain_password, hashed_password)
+    
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """Hash password in a worker thread so bcrypt doesn't block the event loop"""
+        return await asyncio.to_thread(_bcrypt_hash, password)
+    
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """Verify password in a worker thread so bcrypt doesn't block the event loop"""
+        return await asyncio.to_thread(_bcrypt_verify, plain_password, hashed_password)
     
     @staticmethod
     def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT access token"""
         to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.now(timezone.utc) + expires_delta
-        else:
-            expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        lifetime = int(expires_delta.total_seconds()) if expires_delta else _ACCESS_DELTA_S
+        expire = int(time.time()) + lifetime
         
         to_encode.update({"exp": expire, "type": "access"})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-        return encoded_jwt
+        return _encode_jwt(to_encode)
     
     @staticmethod
     def create_refresh_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
         """Create JWT refresh token"""
         to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.now(timezone.utc) + expires_delta
-        else:
-            expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        lifetime = int(expires_delta.total_seconds()) if expires_delta else _REFRESH_DELTA_S
+        expire = int(time.time()) + lifetime
         
         to_encode.update({"exp": expire, "type": "refresh"})
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-        return encoded_jwt
+        return _encode_jwt(to_encode)
     
     @staticmethod
     def create_token_pair(user_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -79,46 +146,48 @@ class TokenHandler:
     @staticmethod
     def decode_token(token: str) -> Optional[Dict[str, Any]]:
         """Decode and validate JWT token"""
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            return payload
-        except JWTError:
+        payload = _decode_cached(token)
+        # A cached payload may outlive its token, so re-check expiry on every call
+        if payload is None or payload.get("exp", 0) <= time.time():
             return None
+        return dict(payload)
+    
+    @staticmethod
+    def verify_and_extract(token: str) -> Optional[TokenInfo]:
+        """Verify token once and return user id, expiry, type and payload"""
+        payload = TokenHandler.decode_token(token)
+        if not payload:
+            return None
+        try:
+            user_id = UUID(payload["user_id"]) if "user_id" in payload else None
+        except (ValueError, TypeError):
+            user_id = None
+        return TokenInfo(user_id, payload.get("exp", 0), payload.get("type"), payload)
     
     @staticmethod
     def extract_user_id(token: str) -> Optional[UUID]:
         """Extract user ID from token"""
-        payload = TokenHandler.decode_token(token)
-        if payload and "user_id" in payload:
-            try:
-                return UUID(payload["user_id"])
-            except (ValueError, TypeError):
-                return None
-        return None
+        info = TokenHandler.verify_and_extract(token)
+        return info.user_id if info else None
     
     @staticmethod
     def is_token_expired(token: str) -> bool:
         """Check if token is expired"""
-        payload = TokenHandler.decode_token(token)
-        if not payload:
-            return True
-        
-        exp = payload.get("exp")
-        if not exp:
-            return True
-        
-        return datetime.now(timezone.utc) > datetime.fromtimestamp(exp, timezone.utc)
+        info = TokenHandler.verify_and_extract(token)
+        return not info or not info.exp or time.time() > info.exp
     
     @staticmethod
     def get_token_type(token: str) -> Optional[str]:
         """Get token type (access or refresh)"""
-        payload = TokenHandler.decode_token(token)
-        return payload.get("type") if payload else None
+        info = TokenHandler.verify_and_extract(token)
+        return info.type if info else None
     
     @staticmethod
-    def hash_refresh_token(refresh_token: str) -> str:
-        """Hash refresh token for database storage"""
-        return hashlib.sha256(refresh_token.encode()).hexdigest()
+    def hash_refresh_token(refresh_token: Union[str, bytes]) -> str:
+        """Hash refresh token for database storage (accepts str or already-encoded bytes)"""
+        if isinstance(refresh_token, str):
+            refresh_token = refresh_token.encode()
+        return hashlib.sha256(refresh_token).hexdigest()
     
     @staticmethod
     def create_password_reset_token(email: str) -> str:
@@ -126,9 +195,9 @@ class TokenHandler:
         data = {
             "email": email,
             "purpose": "password_reset",
-            "exp": datetime.now(timezone.utc) + timedelta(hours=1)
+            "exp": int(time.time()) + _RESET_DELTA_S
         }
-        return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
+        return _encode_jwt(data)
     
     @staticmethod
     def create_email_verification_token(email: str) -> str:
@@ -136,37 +205,37 @@ class TokenHandler:
         data = {
             "email": email,
             "purpose": "email_verification",
-            "exp": datetime.now(timezone.utc) + timedelta(days=1)
+            "exp": int(time.time()) + _VERIFY_DELTA_S
         }
-        return jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
+        return _encode_jwt(data)
+    
+    @staticmethod
+    def _verify_purpose_token(token: str, purpose: str) -> Optional[str]:
+        """Verify a single-purpose token and return its email"""
+        payload = TokenHandler.decode_token(token)
+        if payload and payload.get("purpose") == purpose:
+            return payload.get("email")
+        return None
     
     @staticmethod
     def verify_reset_token(token: str) -> Optional[str]:
         """Verify password reset token and return email"""
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            if payload.get("purpose") == "password_reset":
-                return payload.get("email")
-        except JWTError:
-            pass
-        return None
+        return TokenHandler._verify_purpose_token(token, "password_reset")
     
     @staticmethod
     def verify_email_token(token: str) -> Optional[str]:
         """Verify email verification token and return email"""
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            if payload.get("purpose") == "email_verification":
-                return payload.get("email")
-        except JWTError:
-            pass
-        return None
+        return TokenHandler._verify_purpose_token(token, "email_verification")
+
+
+# User agent keywords, checked in priority order by extract_device_info
+_UA_BROWSERS = (("chrome", "Chrome"), ("firefox", "Firefox"), ("safari", "Safari"), ("edge", "Edge"))
+_UA_KEYWORDS = re.compile(r"chrome|firefox|safari|edge|windows|macintosh|mac os|linux|android|iphone|ipad")
 
 
 # Security utilities
 def generate_secure_token(length: int = 32) -> str:
     """Generate secure random token"""
-    import secrets
     return secrets.token_urlsafe(length)
 
 
@@ -199,30 +268,27 @@ def extract_device_info(user_agent: str) -> Dict[str, Optional[str]]:
     if not user_agent:
         return device_info
     
-    user_agent_lower = user_agent.lower()
+    # One scan for all keywords, then pick by priority below
+    found = set(_UA_KEYWORDS.findall(user_agent.lower()))
     
     # Browser detection
-    if "chrome" in user_agent_lower:
-        device_info["browser"] = "Chrome"
-    elif "firefox" in user_agent_lower:
-        device_info["browser"] = "Firefox"
-    elif "safari" in user_agent_lower:
-        device_info["browser"] = "Safari"
-    elif "edge" in user_agent_lower:
-        device_info["browser"] = "Edge"
+    for keyword, browser in _UA_BROWSERS:
+        if keyword in found:
+            device_info["browser"] = browser
+            break
     
     # OS detection
-    if "windows" in user_agent_lower:
+    if "windows" in found:
         device_info["os"] = "Windows"
-    elif "macintosh" in user_agent_lower or "mac os" in user_agent_lower:
+    elif "macintosh" in found or "mac os" in found:
         device_info["os"] = "macOS"
-    elif "linux" in user_agent_lower:
+    elif "linux" in found:
         device_info["os"] = "Linux"
-    elif "android" in user_agent_lower:
+    elif "android" in found:
         device_info["os"] = "Android"
         device_info["device_type"] = "mobile"
-    elif "iphone" in user_agent_lower or "ipad" in user_agent_lower:
+    elif "iphone" in found or "ipad" in found:
         device_info["os"] = "iOS"
-        device_info["device_type"] = "mobile" if "iphone" in user_agent_lower else "tablet"
+        device_info["device_type"] = "mobile" if "iphone" in found else "tablet"
     
-    return device_info 
\ No newline at end of file
+    return device_info
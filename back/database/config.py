@@ -3,23 +3,24 @@ Database Configuration 🤖
 ChartHut Cyberpunk Data Layer
 """
 import os
+import asyncio
+import logging
 from typing import AsyncGenerator
+from uuid import uuid4
 from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, Session
-from databases import Database
-from dotenv import load_dotenv
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.engine import make_url
 from sqlalchemy import text
+from back.utils.env import load_env
 
-load_dotenv()
+load_env()
+logger = logging.getLogger("chathut.database")
 
 # Use SQLite for development, PostgreSQL for production
 IS_LOCAL = os.getenv("ENV") == "development" or not os.getenv("DATABASE_URL")
 
-print(f"🔧 ENV variable: '{os.getenv('ENV')}'")
-print(f"🔧 DATABASE_URL exists: {bool(os.getenv('DATABASE_URL'))}")
-print(f"🔧 IS_LOCAL determined as: {IS_LOCAL}")
-
 if IS_LOCAL:
     # SQLite for local development - in back folder
     DATABASE_URL = "sqlite:///./chathut_dev.db"
@@ -27,60 +28,87 @@ if IS_LOCAL:
 else:
     # PostgreSQL for production
     DATABASE_URL = os.getenv("DATABASE_URL")
-    print(f"🔧 Raw DATABASE_URL: {DATABASE_URL}")
     
     if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-        print(f"🔧 Fixed DATABASE_URL: {DATABASE_URL}")
     
     # Use asyncpg for async PostgreSQL connections
     if DATABASE_URL:
         ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
-        print(f"🔧 ASYNC_DATABASE_URL: {ASYNC_DATABASE_URL}")
     else:
-        print("🚨 ERROR: DATABASE_URL is None!")
         ASYNC_DATABASE_URL = None
     
     # Ensure SSL is required for production database connections
     if DATABASE_URL and "ondigitalocean.com" in DATABASE_URL:
         ASYNC_DATABASE_URL = f"{ASYNC_DATABASE_URL}?ssl=require"
-        print(f"🔧 ASYNC_DATABASE_URL with SSL: {ASYNC_DATABASE_URL}")
 
-# SQLAlchemy engines
-print(f"🔧 Database Config - IS_LOCAL: {IS_LOCAL}")
-print(f"🔧 DATABASE_URL: {DATABASE_URL[:50]}...")
-print(f"🔧 ASYNC_DATABASE_URL: {ASYNC_DATABASE_URL[:50]}...")
+# Async connection pool - keep warm connections instead of reconnecting per request
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(DB_POOL_SIZE * 2)))
+DB_POOL_MIN_IDLE = min(int(os.getenv("DB_POOL_MIN_IDLE", "2")), DB_POOL_SIZE)
+ASYNC_POOL_OPTIONS = {
+    "poolclass": AsyncAdaptedQueuePool,
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    "pool_timeout": 30,
+}
+
+# asyncpg prepared statements cached per connection, so repeated queries skip parse/plan
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+ASYNCPG_CONNECT_ARGS = {
+    "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    "command_timeout": DB_COMMAND_TIMEOUT,
+}
+
+# Behind pgbouncer in transaction mode a prepared statement can land on another
+# server connection, so turn off statement caching and give each one a unique name
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "").lower() in ("1", "true", "yes")
+if DB_PGBOUNCER:
+    ASYNCPG_CONNECT_ARGS.update({
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    })
 
+# SQLAlchemy engines
 if IS_LOCAL:
     # Use sync SQLite for local development
-    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **ASYNC_POOL_OPTIONS)
     sync_engine = create_engine(DATABASE_URL, echo=False)
-    print("🔧 Created SQLite engines (local)")
 else:
     # Use async engine for production
     if not DATABASE_URL or not ASYNC_DATABASE_URL:
         raise ValueError("🚨 DATABASE_URL and ASYNC_DATABASE_URL must be set for production!")
     
     try:
-        async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            echo=False,
+            connect_args=ASYNCPG_CONNECT_ARGS,
+            **ASYNC_POOL_OPTIONS
+        )
         sync_engine = create_engine(DATABASE_URL, echo=False)
-        print("🔧 Created PostgreSQL engines (production)")
     except Exception as e:
-        print(f"🚨 Error creating database engines: {e}")
+        logger.error("Error creating database engines: %s", e)
         raise
 
+logger.debug(
+    "Database config: ENV=%r IS_LOCAL=%s url=%s",
+    os.getenv("ENV"), IS_LOCAL, make_url(ASYNC_DATABASE_URL).render_as_string(hide_password=True)
+)
+
 # Session makers
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
 AsyncSessionLocal = async_sessionmaker(
     async_engine, class_=AsyncSession, expire_on_commit=False
 )
 
-print(f"🔧 sync_engine type: {type(sync_engine)}")
-print(f"🔧 async_engine type: {type(async_engine)}")
-print(f"🔧 AsyncSessionLocal type: {type(AsyncSessionLocal)}")
-
-# Database instance for direct queries
-database = Database(ASYNC_DATABASE_URL)
+# Database instance for direct queries, created on first connect so `databases` is only imported when used
+database = None
 
 
 def get_db() -> Session:
@@ -97,13 +125,38 @@ async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         try:
             yield session
+        except Exception:
+            await session.rollback()
+            raise
         finally:
             await session.close()
 
 
+async def prewarm_async_pool(count: int = DB_POOL_MIN_IDLE):
+    """Open pool connections up front so the first requests don't pay connect/TLS latency"""
+    if count <= 0:
+        return
+    # return_exceptions so one failed connect doesn't leave the others checked out
+    results = await asyncio.gather(
+        *(async_engine.connect() for _ in range(count)), return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for result in results:
+        if not isinstance(result, BaseException):
+            await result.close()  # returns it to the pool, still open
+    if errors:
+        logger.warning("Async pool prewarm failed for %d of %d connections: %s", len(errors), count, errors[0])
+    else:
+        logger.debug("Prewarmed %d async pool connections", count)
+
+
 async def connect_database():
     """Connect to database on startup"""
+    global database
     try:
+        if database is None:
+            from databases import Database
+            database = Database(ASYNC_DATABASE_URL)
         await database.connect()
         print("🤖 Database connected successfully!")
     except Exception as e:
@@ -114,6 +167,8 @@ async def connect_database():
 
 async def disconnect_database():
     """Disconnect from database on shutdown"""
+    if database is None:
+        return
     try:
         await database.disconnect()
         print("🤖 Database disconnected!")
@@ -0,0 +1,7 @@
+-- Migration: Covering index for listing a user's platform sessions
+-- Date: 2026-10-15
+
+-- list_sessions selects only platform, created_at and updated_at by user_id,
+-- so with these columns in INCLUDE PostgreSQL can answer it with an index-only scan
+CREATE INDEX IF NOT EXISTS ix_platform_session_user_list
+    ON platform_sessions(user_id) INCLUDE (platform, created_at, updated_at);
@@ -0,0 +1,6 @@
+-- Migration: Ensure unique (user_id, platform) index on platform_sessions
+-- Date: 2026-10-15
+
+-- Required by INSERT ... ON CONFLICT (user_id, platform) in save_session,
+-- and serves the get/delete lookups by (user_id, platform)
+CREATE UNIQUE INDEX IF NOT EXISTS ix_platform_session_unique ON platform_sessions(user_id, platform);
@@ -0,0 +1,7 @@
+-- Migration: Enforce lowercase usernames
+-- Date: 2026-10-15
+
+-- Registration already lowercases usernames and lookups lowercase their input,
+-- so the existing unique index on username serves case-insensitive login.
+-- NOT VALID skips scanning existing rows; new and updated rows are checked.
+ALTER TABLE users ADD CONSTRAINT ck_users_username_lower CHECK (username = lower(username)) NOT VALID;
@@ -0,0 +1,9 @@
+-- Migration: Fill created_at/updated_at from the database clock
+-- Date: 2026-10-15
+
+-- TimestampMixin now uses server_default=now() on PostgreSQL instead of a Python
+-- default, so tables created by create_all before this need the column defaults
+ALTER TABLE users ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE users ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE platform_sessions ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE platform_sessions ALTER COLUMN updated_at SET DEFAULT now();
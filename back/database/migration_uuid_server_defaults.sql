@@ -0,0 +1,8 @@
+-- Migration: Generate primary key UUIDs in PostgreSQL
+-- Date: 2026-10-15
+
+-- The models no longer create ids in Python (default=uuid4); the INSERT takes the
+-- id from the column default and hands it back via RETURNING, so existing tables
+-- need the default set. gen_random_uuid() is built in from PostgreSQL 13 (pgcrypto before)
+ALTER TABLE users ALTER COLUMN id SET DEFAULT gen_random_uuid();
+ALTER TABLE platform_sessions ALTER COLUMN id SET DEFAULT gen_random_uuid();
@@ -1,7 +1,7 @@
 # Global instances for the application
 telegram_manager = None
 
-def get_telegram_manager():
+async def get_telegram_manager():
     """Get the global telegram manager instance"""
     if telegram_manager is None:
         raise Exception("Telegram manager not initialized")
@@ -1,16 +1,18 @@
 import sys
 import os
 
-# Add the project root to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 import uvicorn
 import asyncio
+import logging
+import time
+import orjson
+from contextlib import asynccontextmanager
+from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
-from dotenv import load_dotenv
+from typing import Optional
 
 from back.telegram.telegram_client import TelegramClientManager
 from back.api.auth import router as auth_router
@@ -21,62 +23,106 @@ from back.api.telegram import router as telegram_router
 from back.api.whatsapp import router as whatsapp_router
 from back.api.sessions import router as sessions_router
 from back.api.ai import router as ai_router
-from back.database.config import connect_database, disconnect_database, init_database, test_connection
+from back.database.config import connect_database, disconnect_database, init_database, prewarm_async_pool, test_connection
 from back.utils.websocket_monitor import ws_monitor
+from back.utils.logging_config import setup_logging
+from back.utils.env import load_env
 import back.globals as globals
 
 # Load environment variables
-load_dotenv()
+load_env()
+setup_logging()
+logger = logging.getLogger("chathut.main")
+
 
-app = FastAPI(title="ChartHut Cyberpunk API 🤖", version="0.7.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize database and services on startup, clean up on shutdown"""
+    global telegram_manager
+    logger.info("Starting ChartHut Cyberpunk API...")
+    
+    # Built here rather than at import so the reloader parent and tooling that
+    # imports main don't pay for it, and shutdown can disconnect its clients
+    telegram_manager = TelegramClientManager()
+    globals.set_telegram_manager(telegram_manager)
+    
+    # Test database connection (sync drivers, so keep them off the event loop)
+    if await asyncio.to_thread(test_connection):
+        logger.info("Database connection successful")
+        # Initialize database tables and connect database
+        await asyncio.gather(asyncio.to_thread(init_database), connect_database(), prewarm_async_pool())
+    else:
+        logger.error("Database connection failed! Some features may not work.")
+    
+    # Disconnect Telegram clients that sit idle instead of reconnecting per request
+    telegram_eviction_task = asyncio.create_task(telegram_manager.run_idle_eviction())
+    heartbeat_task = asyncio.create_task(heartbeat_broadcaster())
+    
+    logger.info("ChartHut API is ready")
+    yield
+    
+    logger.info("Shutting down ChartHut API...")
+    telegram_eviction_task.cancel()
+    heartbeat_task.cancel()
+    # Let both loops finish unwinding before their clients and sockets go away
+    await asyncio.gather(telegram_eviction_task, heartbeat_task, return_exceptions=True)
+    await telegram_manager.disconnect_all()
+    await disconnect_database()
+    logger.info("Shutdown complete")
+
+
+app = FastAPI(
+    title="ChartHut Cyberpunk API 🤖",
+    version="0.7.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
+
+
+@app.exception_handler(SQLAlchemyError)
+async def database_error_handler(request: Request, exc: SQLAlchemyError):
+    """Database failures surface as a JSON 500 without a try/except in every endpoint"""
+    logging.getLogger("chathut.db").error("Database error on %s: %s", request.url.path, exc)
+    return JSONResponse(status_code=500, content={"detail": "Database error"})
 
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://localhost:3000",
-        "https://chathut.net",
-        "https://www.chathut.net",
-    ],
+    # Same four origins as before: dev servers over http, chathut.net (+www) over https
+    allow_origin_regex=r"http://localhost:(5173|3000)|https://(www\.)?chathut\.net",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 
-# Startup events
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database and services on startup"""
-    print("🤖 Starting ChartHut Cyberpunk API...")
-    
-    # Test database connection
-    if test_connection():
-        print("🤖 Database connection successful!")
-        # Initialize database tables
-        init_database()
-        # Connect database
-        await connect_database()
-    else:
-        print("🚨 Database connection failed! Some features may not work.")
-    
-    print("🤖 ChartHut API is ready!")
+# Telegram client manager - GLOBAL INSTANCE, created in lifespan
+telegram_manager: Optional[TelegramClientManager] = None
 
+HEARTBEAT_INTERVAL = 30
+# Pre-encoded control frames (clients parse text frames, so keep them str)
+PING_FRAME = orjson.dumps({"type": "ping"}).decode()
+PONG_FRAME = orjson.dumps({"type": "pong"}).decode()
 
-# Shutdown events
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown"""
-    print("🤖 Shutting down ChartHut API...")
-    await disconnect_database()
-    print("🤖 Shutdown complete!")
-
-# Initialize Telegram client manager - GLOBAL INSTANCE
-telegram_manager = TelegramClientManager()
 
-# Set the global telegram manager using globals module
-globals.set_telegram_manager(telegram_manager)
+async def heartbeat_broadcaster():
+    """Ping every Telegram WebSocket from one timer instead of a receive timeout per connection"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        sockets = [
+            (session_id, websocket)
+            for session_id, ws_list in telegram_manager.websockets.items()
+            for websocket in ws_list
+        ]
+        if not sockets:
+            continue
+        # Failed sends are cleaned up by the connection's own receive loop
+        results = await asyncio.gather(
+            *(websocket.send_text(PING_FRAME) for _, websocket in sockets),
+            return_exceptions=True
+        )
+        for (session_id, _), result in zip(sockets, results):
+            ws_monitor.log_message_sent(session_id, "ping", not isinstance(result, Exception))
 
 # Include routers
 app.include_router(auth_router, prefix="/api/auth", tags=["Authentication"])
@@ -88,31 +134,51 @@ app.include_router(whatsapp_router, prefix="/api", tags=["WhatsApp"])
 app.include_router(sessions_router, prefix="/api/sessions", tags=["Sessions"])
 app.include_router(ai_router, prefix="/api/ai", tags=["AI Assistant"])
 
-@app.get("/")
+# Constant payload; returning the response directly skips jsonable_encoder
+_ROOT_PAYLOAD = {
+    "message": "ChartHut API 🤖",
+    "status": "running",
+    "version": "0.7.0",
+    "features": [
+        "🔐 Advanced Authentication System",
+        "📡 Real-time Communication",
+        "🗄️ SQLite Database",
+        "⚡ Fast Messaging"
+    ]
+}
+
+
+@app.get("/", response_model=None)
 async def root():
-    return {
-        "message": "ChartHut API 🤖",
-        "status": "running",
-        "version": "0.7.0",
-        "features": [
-            "🔐 Advanced Authentication System",
-            "📡 Real-time Communication",
-            "🗄️ SQLite Database",
-            "⚡ Fast Messaging"
-        ]
-    }
+    return ORJSONResponse(_ROOT_PAYLOAD)
 
-@app.get("/api/health")
-async def health_check():
-    total_websockets = sum(len(ws_list) for ws_list in telegram_manager.websockets.values())
-    return {
+# Health probes hit this often; second-granularity timestamp is enough
+_ts_cache = (0.0, "")
+
+
+def _now_iso() -> str:
+    global _ts_cache
+    now = time.time()
+    if now - _ts_cache[0] >= 1:
+        _ts_cache = (now, datetime.fromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+
+def _status_response() -> ORJSONResponse:
+    # Plain dict of str/int values, so hand it straight to orjson without jsonable_encoder
+    return ORJSONResponse({
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": _now_iso(),
         "active_sessions": len(telegram_manager.active_clients),
         "websocket_sessions": len(telegram_manager.websockets),
-        "total_websocket_connections": total_websockets,
+        "total_websocket_connections": telegram_manager.total_ws_count,
         "websocket_stats": ws_monitor.get_stats()
-    }
+    })
+
+
+@app.get("/api/health", response_model=None)
+async def health_check():
+    return _status_response()
 
 # WebSocket для real-time обновлений
 @app.websocket("/ws/{session_id}")
@@ -126,30 +192,29 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         ws_monitor.log_connection(session_id, "REGISTERED", "Added to telegram manager")
         
         # Send initial connection confirmation
-        await websocket.send_text('{"type": "connected", "session_id": "' + session_id + '"}')
+        await websocket.send_text(orjson.dumps({"type": "connected", "session_id": session_id}).decode())
         
+        # Heartbeat pings come from heartbeat_broadcaster; here we only answer client messages
         while True:
             try:
-                # Wait for client messages or timeout after 30 seconds
-                try:
-                    # Use receive_text with timeout to detect disconnections faster
-                    message = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
-                    # Handle ping/pong messages
-                    if message:
-                        import json
-                        try:
-                            data = json.loads(message)
-                            if data.get("type") == "ping":
-                                await websocket.send_text('{"type": "pong"}')
-                                ws_monitor.log_message_sent(session_id, "pong", True)
-                        except json.JSONDecodeError:
-                            # Non-JSON message, ignore
-                            pass
-                except asyncio.TimeoutError:
-                    # No message received in 30 seconds, send heartbeat
-                        await websocket.send_text('{"type": "ping"}')
-                        ws_monitor.log_message_sent(session_id, "ping", True)
-                    
+                message = await websocket.receive_text()
+                # Fast path: a compact {"type":"ping"} (JSON.stringify output) skips the parser
+                if message == PING_FRAME:
+                    await websocket.send_text(PONG_FRAME)
+                    ws_monitor.log_message_sent(session_id, "pong", True)
+                    continue
+                # Handle ping/pong messages
+                if message:
+                    try:
+                        data = orjson.loads(message)
+                        if isinstance(data, dict) and data.get("type") == "ping":
+                            await websocket.send_text(PONG_FRAME)
+                            ws_monitor.log_message_sent(session_id, "pong", True)
+                    except orjson.JSONDecodeError:
+                        # Non-JSON message, ignore
+                        pass
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 ws_monitor.log_connection(session_id, "HEARTBEAT_FAILED", f"Connection error: {str(e)}")
                 break
@@ -161,29 +226,30 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     finally:
         # Cleanup in all cases
         try:
-                await telegram_manager.remove_websocket_connection(session_id, websocket)
-                ws_monitor.cleanup_session(session_id)
+            await telegram_manager.remove_websocket_connection(session_id, websocket)
+            ws_monitor.cleanup_session(session_id)
         except Exception as cleanup_error:
-            print(f"Error during WebSocket cleanup: {cleanup_error}")
+            logger.error("Error during WebSocket cleanup: %s", cleanup_error)
 
 # Monitoring endpoint
-@app.get("/api/monitor")
+@app.get("/api/monitor", response_model=None)
 async def monitor_websockets():
-    total_websockets = sum(len(ws_list) for ws_list in telegram_manager.websockets.values())
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "active_sessions": len(telegram_manager.active_clients),
-        "websocket_sessions": len(telegram_manager.websockets),
-        "total_websocket_connections": total_websockets,
-        "websocket_stats": ws_monitor.get_stats()
-    }
+    return _status_response()
 
 if __name__ == "__main__":
+    is_development = os.getenv("ENV") == "development"
     uvicorn.run(
-        "main:app",
+        "back.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
+        # uvloop is POSIX-only; httptools is the C HTTP parser
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        reload=is_development,
+        # Telegram clients and WebSockets live in process memory, so only raise
+        # WEB_CONCURRENCY once sessions are pinned to a worker (or shared via pub/sub)
+        workers=1 if is_development else int(os.getenv("WEB_CONCURRENCY", "1")),
+        log_level="info",
+        # Keep the queue-backed root handlers from setup_logging instead of uvicorn's own
+        log_config=None
     ) 
\ No newline at end of file
@@ -3,12 +3,25 @@ Cyberpunk Authentication Models 🤖
 ChartHut User Management System
 """
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from typing import Annotated, Optional, Dict, Any, List, Union
 from uuid import UUID, uuid4
-from pydantic import BaseModel, EmailStr, Field, validator, constr
+from pydantic import BaseModel, BeforeValidator, ConfigDict, EmailStr, Field, field_validator, constr, ValidationInfo
 from enum import Enum
 
 
+def _uuid_to_bytes(v: Union[UUID, str, bytes]) -> bytes:
+    if isinstance(v, UUID):
+        return v.bytes
+    if isinstance(v, bytes) and len(v) == 16:
+        return v
+    return UUID(str(v)).bytes
+
+
+# Internal UUID form: 16 raw bytes, validated by pydantic-core's bytes path.
+# Public response models keep UUID so the API still returns canonical strings.
+UUIDBytes = Annotated[bytes, BeforeValidator(_uuid_to_bytes)]
+
+
 class LanguageCode(str, Enum):
     """Supported language codes for i18n"""
     EN = "en"
@@ -39,7 +52,8 @@ class UserBase(BaseModel):
     language_preference: LanguageCode = LanguageCode.EN
     theme_preference: ThemePreference = ThemePreference.CYBERPUNK
     
-    @validator('username')
+    @field_validator('username')
+    @classmethod
     def validate_username(cls, v):
         if v.lower() in ['admin', 'root', 'system', 'chathut']:
             raise ValueError('Username not allowed')
@@ -48,21 +62,18 @@ class UserBase(BaseModel):
 
 class UserCreate(UserBase):
     """User creation model"""
+    # Length is the only password rule; pydantic-core enforces it before any Python validator runs
     password: str = Field(..., min_length=6, max_length=128)
     confirm_password: str
 
-    @validator('confirm_password')
-    def passwords_match(cls, v, values):
-        if 'password' in values and v != values['password']:
+    @field_validator('confirm_password')
+    @classmethod
+    def passwords_match(cls, v, info: ValidationInfo):
+        # password is declared first, so it's in info.data unless it failed validation itself
+        if 'password' in info.data and v != info.data['password']:
             raise ValueError('Passwords do not match')
         return v
 
-    @validator('password')
-    def validate_password(cls, v):
-        if len(v) < 6:
-            raise ValueError('Password must be at least 6 characters long')
-        return v
-
 
 class UserUpdate(BaseModel):
     """User update model"""
@@ -86,8 +97,7 @@ class UserResponse(BaseModel):
     email: EmailStr
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class UserProfile(UserResponse):
@@ -95,8 +105,7 @@ class UserProfile(UserResponse):
     telegram_connected: bool = False
     ai_preferences: Optional[Dict[str, Any]] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Authentication Models
@@ -111,7 +120,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     """JWT Token payload data"""
-    user_id: Optional[UUID] = None
+    user_id: Optional[UUIDBytes] = None
     username: Optional[str] = None
     email: Optional[str] = None
     exp: Optional[int] = None
@@ -150,8 +159,7 @@ class UserSessionResponse(BaseModel):
     last_used: Optional[datetime] = None
     is_active: bool
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # User Preferences Models
@@ -182,8 +190,7 @@ class UserPreferencesResponse(AIPreferences):
     created_at: datetime
     updated_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 
@@ -245,9 +252,11 @@ class PasswordResetConfirm(BaseModel):
     new_password: str = Field(..., min_length=8, max_length=128)
     confirm_password: str
     
-    @validator('confirm_password')
-    def passwords_match(cls, v, values):
-        if 'new_password' in values and v != values['new_password']:
+    @field_validator('confirm_password')
+    @classmethod
+    def passwords_match(cls, v, info: ValidationInfo):
+        # new_password is declared first, so it's in info.data unless it failed validation itself
+        if 'new_password' in info.data and v != info.data['new_password']:
             raise ValueError('Passwords do not match')
         return v
 
@@ -267,5 +276,4 @@ class ProfileResponse(BaseModel):
     created_at: datetime
     connected_accounts: List[ConnectedAccount]
 
-    class Config:
-        from_attributes = True 
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True) 
\ No newline at end of file
@@ -3,19 +3,24 @@ SQLAlchemy Database Models 🤖
 ChartHut Cyberpunk Data Layer
 """
 from datetime import datetime, timezone
-from typing import Optional
+from itertools import islice
+from typing import Iterable, List, Optional
 from uuid import UUID, uuid4
 from sqlalchemy import (
-    Boolean, Column, DateTime, Integer, String, Text, 
-    ForeignKey, BigInteger, Index, JSON, func, select
+    Boolean, CheckConstraint, Column, DateTime, Integer, String, Text, 
+    ForeignKey, BigInteger, Index, JSON, func, insert, select, update
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, Session, selectinload
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import UUID as PGUUID, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import logging
 import os
 
+logger = logging.getLogger("chathut.models")
+
 Base = declarative_base()
 
 # Check if we're in production (PostgreSQL) or development (SQLite)
@@ -27,31 +32,57 @@ def generate_uuid():
     return str(uuid4())
 
 
+# Primary/foreign key column type: UUID for PostgreSQL, String for SQLite
+# (plus the dialect's INSERT, which carries ON CONFLICT support)
+if IS_LOCAL:
+    ID_TYPE = String(36)
+    ID_DEFAULT = {"default": generate_uuid}
+    dialect_insert = sqlite_insert
+else:
+    ID_TYPE = PGUUID(as_uuid=True)
+    ID_DEFAULT = {"server_default": text("gen_random_uuid()")}
+    dialect_insert = pg_insert
+
+
 class TimestampMixin:
     """Mixin for timestamp columns"""
-    created_at = Column(
-        DateTime(timezone=True), 
-        default=lambda: datetime.now(timezone.utc),
-        nullable=False
-    )
-    updated_at = Column(
-        DateTime(timezone=True), 
-        default=lambda: datetime.now(timezone.utc),
-        onupdate=lambda: datetime.now(timezone.utc),
-        nullable=False
-    )
+    if IS_LOCAL:
+        # SQLite can't add a column default to existing tables, so keep local dev DBs on Python defaults
+        created_at = Column(
+            DateTime(timezone=True), 
+            default=lambda: datetime.now(timezone.utc),
+            nullable=False
+        )
+        updated_at = Column(
+            DateTime(timezone=True), 
+            default=lambda: datetime.now(timezone.utc),
+            onupdate=lambda: datetime.now(timezone.utc),
+            nullable=False
+        )
+    else:
+        # PostgreSQL fills these from its own clock
+        created_at = Column(
+            DateTime(timezone=True), 
+            server_default=func.now(),
+            nullable=False
+        )
+        updated_at = Column(
+            DateTime(timezone=True), 
+            server_default=func.now(),
+            onupdate=func.now(),
+            nullable=False
+        )
+    
+    # Read server-generated values back via RETURNING, so they're loaded after
+    # INSERT/UPDATE instead of triggering a lazy SELECT on an AsyncSession
+    __mapper_args__ = {"eager_defaults": True}
 
 
 class User(Base, TimestampMixin):
     """User model for authentication and profile management"""
     __tablename__ = "users"
     
-    # Use UUID for PostgreSQL, String for SQLite
-    if IS_LOCAL:
-        id = Column(String(36), primary_key=True, default=generate_uuid)
-    else:
-        from sqlalchemy.dialects.postgresql import UUID as PGUUID
-        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(ID_TYPE, primary_key=True, **ID_DEFAULT)
     
     username = Column(String(50), unique=True, nullable=False, index=True)
     email = Column(String(255), unique=True, nullable=False, index=True)
@@ -66,6 +97,12 @@ class User(Base, TimestampMixin):
     is_whatsapp_connected = Column(Boolean, default=False, nullable=False)
     last_login = Column(DateTime(timezone=True), nullable=True)
     
+    # Usernames are stored lowercased, so lookups lowercase the input and use the
+    # plain unique index on username (no lower(username) functional index needed)
+    __table_args__ = (
+        CheckConstraint("username = lower(username)", name="ck_users_username_lower"),
+    )
+    
     # Relationships
     # sessions = relationship("UserSession", back_populates="user", cascade="all, delete-orphan")  # Disabled for now
     
@@ -102,24 +139,20 @@ class PlatformSession(Base, TimestampMixin):
     """Platform sessions for Telegram and WhatsApp"""
     __tablename__ = "platform_sessions"
     
-    # Use UUID for PostgreSQL, String for SQLite
-    if IS_LOCAL:
-        id = Column(String(36), primary_key=True, default=generate_uuid)
-        user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    else:
-        from sqlalchemy.dialects.postgresql import UUID as PGUUID
-        id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid4)
-        user_id = Column(PGUUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    id = Column(ID_TYPE, primary_key=True, **ID_DEFAULT)
+    user_id = Column(ID_TYPE, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     
     platform = Column(String(20), nullable=False)  # "telegram" or "whatsapp"
     session_string = Column(Text, nullable=False)
     
-    # Relationships
-    user = relationship("User")
+    # Relationships (nothing loads this implicitly; use selectinload/joinedload when needed)
+    user = relationship("User", lazy="raise_on_sql")
     
     # Unique constraint for user-platform pair
     __table_args__ = (
         Index('ix_platform_session_unique', 'user_id', 'platform', unique=True),
+        # Covering index so list_sessions is an index-only scan on PostgreSQL (ignored by SQLite)
+        Index('ix_platform_session_user_list', 'user_id', postgresql_include=['platform', 'created_at', 'updated_at']),
     )
     
     def __repr__(self):
@@ -131,17 +164,17 @@ class PlatformSession(Base, TimestampMixin):
 
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     """Get user by email"""
-    return db.query(User).filter(User.email == email).first()
+    return db.execute(select(User).where(User.email == email)).scalar_one_or_none()
 
 
 def get_user_by_username(db: Session, username: str) -> Optional[User]:
     """Get user by username"""
-    return db.query(User).filter(User.username == username.lower()).first()
+    return db.execute(select(User).where(User.username == username.lower())).scalar_one_or_none()
 
 
 def get_user_by_id(db: Session, user_id: UUID) -> Optional[User]:
     """Get user by ID"""
-    return db.query(User).filter(User.id == user_id).first()
+    return db.execute(select(User).where(User.id == user_id)).scalar_one_or_none()
 
 
 def get_user_by_email_or_username(db: Session, email_or_username: str) -> Optional[User]:
@@ -162,11 +195,19 @@ def create_user(db: Session, user_data: dict) -> User:
     return user
 
 
+def _last_login_update(user_id):
+    # One UPDATE with a server-side timestamp; no SELECT first, no identity-map sync
+    return (
+        update(User)
+        .where(User.id == user_id)
+        .values(last_login=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+
 def update_user_last_login(db: Session, user_id: UUID):
     """Update user's last login timestamp"""
-    db.query(User).filter(User.id == user_id).update({
-        "last_login": datetime.now(timezone.utc)
-    })
+    db.execute(_last_login_update(user_id))
     db.commit()
 
 
@@ -187,14 +228,16 @@ async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[User
 
 async def get_user_by_username_async(db: AsyncSession, username: str) -> Optional[User]:
     """Fetch a user by username asynchronously."""
-    result = await db.execute(select(User).where(User.username == username))
+    result = await db.execute(select(User).where(User.username == username.lower()))
     return result.scalar_one_or_none()
 
 
-async def get_user_by_id_async(db: AsyncSession, user_id: str) -> Optional[User]:
+async def get_user_by_id_async(db: AsyncSession, user_id: UUID) -> Optional[User]:
     """Get user by ID asynchronously"""
-    result = await db.execute(select(User).where(User.id == user_id))
-    return result.scalar_one_or_none()
+    # Session.get checks the identity map first, so repeat lookups within one
+    # request (one AsyncSession) don't go back to the database. The identity key
+    # must match the column type: str for SQLite's String(36), UUID for PostgreSQL
+    return await db.get(User, str(user_id) if IS_LOCAL else user_id)
 
 
 async def get_user_by_email_or_username_async(db: AsyncSession, email_or_username: str) -> Optional[User]:
@@ -208,33 +251,54 @@ async def get_user_by_email_or_username_async(db: AsyncSession, email_or_usernam
 async def create_user_async(db: AsyncSession, user_data: dict) -> User:
     """Create a new user (async)"""
     try:
-        print(f"🔧 Creating user with data: {user_data.get('username', 'unknown')}")
         user = User(**user_data)
-        print(f"🔧 User object created: {user.id}")
         db.add(user)
-        print(f"🔧 User added to session")
+        # Server-generated id/timestamps come back via RETURNING (eager_defaults) and the
+        # session doesn't expire on commit, so the INSERT + COMMIT is the whole round trip
         await db.commit()
-        print(f"🔧 Database commit successful")
-        await db.refresh(user)
-        print(f"🔧 User refreshed from database: {user.id}")
+        logger.debug("Created user %s (%s)", user.id, user.username)
         return user
-    except Exception as e:
-        print(f"❌ Error creating user: {e}")
-        print(f"❌ Error type: {type(e)}")
-        import traceback
-        print(f"❌ Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error creating user %s", user_data.get("username", "unknown"))
         raise
 
 
+async def bulk_create_users_async(db: AsyncSession, users: Iterable[dict], batch_size: int = 1000) -> List:
+    """Insert many users (admin imports, fixtures) as one multi-row INSERT and commit per batch"""
+    user_ids = []
+    # Same normalisation create_user_async callers get: usernames stored lowercased
+    # (ck_users_username_lower). Column defaults (id, timestamps, preferences) are
+    # filled per row by the Core insert just as the ORM would
+    users = ({**user, "username": user["username"].lower()} for user in users)
+    while batch := list(islice(users, batch_size)):
+        result = await db.execute(insert(User).returning(User.id), batch)
+        user_ids.extend(result.scalars().all())
+        await db.commit()
+    return user_ids
+
+
+async def upsert_platform_session_async(db: AsyncSession, user_id, platform: str, session_string: str):
+    """Insert or update a user's platform session in a single INSERT ... ON CONFLICT statement"""
+    stmt = dialect_insert(PlatformSession).values(
+        user_id=user_id,
+        platform=platform,
+        session_string=session_string
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PlatformSession.user_id, PlatformSession.platform],
+        set_={
+            "session_string": stmt.excluded.session_string,
+            "updated_at": func.now()
+        }
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
 async def update_user_last_login_async(db: AsyncSession, user_id: str):
     """Update user's last login timestamp (async)"""
-    result = await db.execute(
-        select(User).where(User.id == user_id)
-    )
-    user = result.scalar_one_or_none()
-    if user:
-        user.last_login = datetime.now(timezone.utc)
-        await db.commit()
+    await db.execute(_last_login_update(user_id))
+    await db.commit()
 
 
 
@@ -1,14 +1,62 @@
 import os
 import asyncio
 import json
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import google.generativeai as genai
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, PayloadSchemaType,
+    Filter, FieldCondition, MatchValue, MatchAny,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType
+)
 import hashlib
 import tiktoken
 
+# Texts per embedding request / points per upsert when vectorizing chat history
+EMBED_BATCH_SIZE = 100
+# Embedding batches in flight at once
+EMBED_CONCURRENCY = 4
+
+
+# Embeddings of recently embedded texts (repeat queries, re-synced chunks), keyed by
+# content hash; stored as float64 arrays, which round-trip the floats exactly
+# (~6 KB each) at a fraction of the size of lists of Python floats
+EMBEDDING_CACHE_SIZE = 4096
+_embedding_cache: "OrderedDict[str, array]" = OrderedDict()
+
+
+def _cached_embedding(key: str) -> Optional[List[float]]:
+    cached = _embedding_cache.get(key)
+    if cached is None:
+        return None
+    _embedding_cache.move_to_end(key)
+    return cached.tolist()
+
+
+def _cache_embedding(key: str, embedding: List[float]):
+    _embedding_cache[key] = array('d', embedding)
+    if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=8192)
+def _count_tokens(text: str) -> int:
+    """Count tokens in text; the same chat lines are counted again on every AI query"""
+    try:
+        return len(_get_tokenizer().encode(text))
+    except Exception:
+        # Fallback estimation
+        return len(text) // 4
+
 class AIService:
     def __init__(self):
         # Initialize Gemini
@@ -24,7 +72,7 @@ class AIService:
         self.qdrant_api_key = os.getenv("QDRANT_API_KEY")
         
         if self.qdrant_url and self.qdrant_api_key:
-            self.qdrant_client = QdrantClient(
+            self.qdrant_client = AsyncQdrantClient(
                 url=self.qdrant_url,
                 api_key=self.qdrant_api_key,
             )
@@ -35,7 +83,7 @@ class AIService:
             print("Warning: Qdrant not configured, using memory-only mode")
         
         # Initialize tokenizer for context management
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        self.tokenizer = _get_tokenizer()
         self.max_context_tokens = 30000  # Conservative limit for Gemini
         self.max_response_tokens = 4000
         
@@ -54,56 +102,94 @@ class AIService:
             return
             
         try:
-            for collection_name in self.collections.values():
-                try:
-                    await asyncio.to_thread(
-                        self.qdrant_client.get_collection,
-                        collection_name
-                    )
-                except Exception:
-                    # Collection doesn't exist, create it
-                    await asyncio.to_thread(
-                        self.qdrant_client.create_collection,
-                        collection_name=collection_name,
-                        vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-                    )
-                    print(f"Created Qdrant collection: {collection_name}")
+            # Collections are independent, check/create them concurrently
+            await asyncio.gather(*[
+                self._ensure_collection(collection_name)
+                for collection_name in self.collections.values()
+            ])
             self._collections_initialized = True
         except Exception as e:
             print(f"Warning: Could not initialize Qdrant collections: {e}")
-            
+
+    async def _ensure_collection(self, collection_name: str):
+        """Create a single collection if it doesn't exist and index its payload"""
+        try:
+            await self.qdrant_client.get_collection(collection_name)
+        except Exception:
+            # Collection doesn't exist, create it
+            await self.qdrant_client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=768, distance=Distance.COSINE),
+                # int8 copies of the vectors stay in RAM for search (4x smaller than float32);
+                # Qdrant rescores the top hits with the original vectors
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+                )
+            )
+            print(f"Created Qdrant collection: {collection_name}")
+        await self._ensure_payload_indexes(collection_name)
+
+    async def _ensure_payload_indexes(self, collection_name: str):
+        """Index the payload fields used in filters so deletes/searches by chat skip full scans"""
+        for field_name in ("user_id", "chat_id", "text_hash"):
+            try:
+                await self.qdrant_client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType.KEYWORD
+                )
+            except Exception as e:
+                print(f"Warning: Could not create payload index {field_name} on {collection_name}: {e}")
+
     async def _init_collections(self):
         """Initialize Qdrant collections if they don't exist (deprecated, use _ensure_collections_initialized)"""
         await self._ensure_collections_initialized()
 
     def _count_tokens(self, text: str) -> int:
         """Count tokens in text"""
-        try:
-            return len(self.tokenizer.encode(text))
-        except:
-            # Fallback estimation
-            return len(text) // 4
+        return _count_tokens(text)
+
+    def _extract_message(self, msg: Dict[str, Any], source: str):
+        """Return (sender, text, timestamp) for a telegram or whatsapp message dict"""
+        if source == 'telegram':
+            sender = msg.get('from_user', {}).get('first_name', 'Unknown') if isinstance(msg.get('from_user'), dict) else str(msg.get('from_user', 'Unknown'))
+            text = msg.get('text', msg.get('message', ''))
+            timestamp = msg.get('date', '')
+        else:  # whatsapp
+            sender = msg.get('sender', msg.get('from', 'Unknown'))
+            text = msg.get('text', msg.get('message', msg.get('body', '')))
+            timestamp = msg.get('timestamp', '')
+        return sender, text, timestamp
 
-    def _truncate_context(self, messages: List[Dict], max_tokens: int) -> List[Dict]:
-        """Truncate context to fit within token limit"""
+    def _build_context_lines(self, messages: List[Dict[str, Any]], source: str, max_tokens: int, max_lines: int) -> List[str]:
+        """Format the most recent messages into prompt lines in a single pass (newest first, within token budget)"""
         total_tokens = 0
-        truncated = []
+        lines = []
         
-        # Process messages in reverse order (most recent first)
         for msg in reversed(messages):
-            msg_text = f"{msg.get('sender', '')}: {msg.get('text', '')}"
-            msg_tokens = self._count_tokens(msg_text)
+            if len(lines) >= max_lines:
+                break
+            sender, text, _ = self._extract_message(msg, source)
+            if not text or not isinstance(text, str) or not text.strip():
+                continue
             
-            if total_tokens + msg_tokens > max_tokens:
+            line = f"{sender}: {text}"
+            line_tokens = self._count_tokens(line)
+            if total_tokens + line_tokens > max_tokens:
                 break
-                
-            truncated.insert(0, msg)
-            total_tokens += msg_tokens
             
-        return truncated
+            lines.append(line)
+            total_tokens += line_tokens
+        
+        lines.reverse()
+        return lines
 
     async def _get_embeddings(self, text: str) -> Optional[List[float]]:
         """Get embeddings for text using Gemini"""
+        key = self._hash_text(text)
+        cached = _cached_embedding(key)
+        if cached is not None:
+            return cached
         try:
             # Use Gemini for embeddings
             result = await asyncio.to_thread(
@@ -111,11 +197,83 @@ class AIService:
                 model="models/embedding-001",
                 content=text
             )
-            return result['embedding']
+            embedding = result['embedding']
+            _cache_embedding(key, embedding)
+            return embedding
         except Exception as e:
             print(f"Embedding error: {e}")
             return None
 
+    async def _get_embeddings_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Get embeddings for many texts at once (the client sends up to 100 per request)"""
+        keys = [self._hash_text(text) for text in texts]
+        embeddings = [_cached_embedding(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        try:
+            # Only the texts that aren't cached go to the API
+            result = await asyncio.to_thread(
+                genai.embed_content,
+                model="models/embedding-001",
+                content=[texts[i] for i in missing]
+            )
+            for i, embedding in zip(missing, result['embedding']):
+                embeddings[i] = embedding
+                _cache_embedding(keys[i], embedding)
+            return embeddings
+        except Exception as e:
+            print(f"Batch embedding error: {e}")
+            return None
+
+    @staticmethod
+    def _hash_text(text: str) -> str:
+        """Stable content hash used to detect chunks that are already stored"""
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    @classmethod
+    def _point_id(cls, user_id: str, chat_id: str, content: str) -> str:
+        """Deterministic point id, so storing the same memory twice overwrites instead of duplicating"""
+        return cls._hash_text(f"{user_id}|{chat_id}|{content}")
+
+    async def _get_existing_hashes(self, user_id: str, chat_id: str, hashes: List[str]) -> set:
+        """Return the subset of text hashes already stored for this chat"""
+        if not hashes:
+            return set()
+        try:
+            points, _ = await self.qdrant_client.scroll(
+                collection_name=self.collections["chat_memory"],
+                scroll_filter=Filter(
+                    must=[
+                        FieldCondition(key="user_id", match=MatchValue(value=str(user_id))),
+                        FieldCondition(key="chat_id", match=MatchValue(value=str(chat_id))),
+                        FieldCondition(key="text_hash", match=MatchAny(any=hashes))
+                    ]
+                ),
+                limit=len(hashes),
+                with_payload=["text_hash"],
+                with_vectors=False
+            )
+            return {point.payload["text_hash"] for point in points if point.payload}
+        except Exception as e:
+            print(f"Existing hash lookup error: {e}")
+            return set()
+
+    @staticmethod
+    def _build_point(point_id: str, user_id: str, chat_id: str, content: str, embeddings: List[float], metadata: Dict) -> PointStruct:
+        """Build the Qdrant point for one memory"""
+        return PointStruct(
+            id=point_id,
+            vector=embeddings,
+            payload={
+                "user_id": user_id,
+                "chat_id": str(chat_id),
+                "content": content,
+                "timestamp": datetime.now().isoformat(),
+                **metadata
+            }
+        )
+
     async def _store_memory(self, user_id: str, chat_id: str, content: str, metadata: Dict):
         """Store conversation memory in vector database"""
         if not self.vector_enabled:
@@ -127,22 +285,10 @@ class AIService:
             if not embeddings:
                 return
                 
-            point_id = hashlib.md5(f"{user_id}_{chat_id}_{datetime.now().isoformat()}".encode()).hexdigest()
-            
-            point = PointStruct(
-                id=point_id,
-                vector=embeddings,
-                payload={
-                    "user_id": user_id,
-                    "chat_id": str(chat_id),
-                    "content": content,
-                    "timestamp": datetime.now().isoformat(),
-                    **metadata
-                }
-            )
+            point_id = self._point_id(user_id, chat_id, content)
+            point = self._build_point(point_id, user_id, chat_id, content, embeddings, metadata)
             
-            await asyncio.to_thread(
-                self.qdrant_client.upsert,
+            await self.qdrant_client.upsert(
                 collection_name=self.collections["chat_memory"],
                 points=[point]
             )
@@ -162,16 +308,16 @@ class AIService:
             if not query_embeddings:
                 return []
                 
-            results = await asyncio.to_thread(
-                self.qdrant_client.search,
+            results = await self.qdrant_client.search(
                 collection_name=self.collections["chat_memory"],
                 query_vector=query_embeddings,
-                query_filter={
-                    "must": [
-                        {"key": "user_id", "match": {"value": user_id}},
-                        {"key": "chat_id", "match": {"value": str(chat_id)}}
+                # Typed filter on the indexed user_id/chat_id payload fields
+                query_filter=Filter(
+                    must=[
+                        FieldCondition(key="user_id", match=MatchValue(value=user_id)),
+                        FieldCondition(key="chat_id", match=MatchValue(value=str(chat_id)))
                     ]
-                },
+                ),
                 limit=limit,
                 score_threshold=0.7
             )
@@ -217,21 +363,10 @@ class AIService:
             
             # Add recent messages context
             if context_messages:
-                truncated_messages = self._truncate_context(context_messages, 25000)  # Увеличили лимит токенов
+                message_lines = self._build_context_lines(context_messages, source, 25000, 200)  # Увеличили лимит токенов
                 context_parts.append("=== RECENT CHAT MESSAGES ===")
-                for msg in truncated_messages[-200:]:  # Last 200 messages
-                    # Handle different message formats
-                    if source == 'telegram':
-                        sender = msg.get('from_user', {}).get('first_name', 'Unknown') if isinstance(msg.get('from_user'), dict) else str(msg.get('from_user', 'Unknown'))
-                        text = msg.get('text', msg.get('message', ''))
-                    else:  # whatsapp
-                        sender = msg.get('sender', msg.get('from', 'Unknown'))
-                        text = msg.get('text', msg.get('message', msg.get('body', '')))
-                    
-                    if text and isinstance(text, str) and text.strip():
-                        context_parts.append(f"{sender}: {text}")
-                        
-                print(f"🤖 Processed {len([p for p in context_parts if p and not p.startswith('===')])} message lines for context")
+                context_parts.extend(message_lines)
+                print(f"🤖 Processed {len(message_lines)} message lines for context")
                 context_parts.append("")
             
             # Add memories if available
@@ -329,8 +464,7 @@ class AIService:
             
             await self._ensure_collections_initialized()
             
-            vectorized_count = 0
-            batch_size = 50  # Process in batches to avoid overwhelming the API
+            batch_size = 50  # Text hashes per existing-chunk lookup
             
             # Group messages into conversation chunks
             conversation_chunks = []
@@ -340,20 +474,17 @@ class AIService:
             
             for msg in all_messages:
                 # Extract message text
-                if source == 'telegram':
-                    sender = msg.get('from_user', {}).get('first_name', 'Unknown') if isinstance(msg.get('from_user'), dict) else str(msg.get('from_user', 'Unknown'))
-                    text = msg.get('text', msg.get('message', ''))
-                    timestamp = msg.get('date', '')
-                else:  # whatsapp
-                    sender = msg.get('sender', msg.get('from', 'Unknown'))
-                    text = msg.get('text', msg.get('message', msg.get('body', '')))
-                    timestamp = msg.get('timestamp', '')
+                sender, text, timestamp = self._extract_message(msg, source)
                 
                 if not text or not isinstance(text, str) or not text.strip():
                     continue
                     
                 message_line = f"[{timestamp}] {sender}: {text}"
-                message_tokens = self._count_tokens(message_line)
+                # ~4 chars per token is close enough while the chunk is far from full;
+                # only run the tokenizer when the decision to split is near
+                message_tokens = len(message_line) // 4
+                if current_chunk_size + message_tokens > 0.8 * max_chunk_tokens:
+                    message_tokens = self._count_tokens(message_line)
                 
                 # If adding this message would exceed chunk size, save current chunk
                 if current_chunk_size + message_tokens > max_chunk_tokens and current_chunk:
@@ -378,47 +509,89 @@ class AIService:
             
             print(f"🧠 Created {len(conversation_chunks)} conversation chunks")
             
-            # Store conversation chunks in vector database
+            # Skip chunks whose content is already stored so re-syncs don't re-embed them
+            chunk_hashes = [self._hash_text(chunk["content"]) for chunk in conversation_chunks]
+            existing_hashes = set().union(*await asyncio.gather(*[
+                self._get_existing_hashes(user_id, chat_id, chunk_hashes[start:start + batch_size])
+                for start in range(0, len(chunk_hashes), batch_size)
+            ]))
+            skipped_count = sum(1 for h in chunk_hashes if h in existing_hashes)
+            if skipped_count:
+                print(f"🧠 Skipping {skipped_count} already vectorized chunks")
+            
+            # Build the stored content for every new chunk
+            pending = []
             for i, chunk in enumerate(conversation_chunks):
-                try:
-                    # Create enhanced content for better search
-                    enhanced_content = f"""
+                if chunk_hashes[i] in existing_hashes:
+                    continue
+                # Create enhanced content for better search
+                enhanced_content = f"""
 Чат: {chat_name} ({source})
 Период: {chunk['start_time']}
 Сообщений в блоке: {chunk['message_count']}
 
 {chunk['content']}
 """
-                    
-                    await self._store_memory(
-                        user_id=user_id,
-                        chat_id=chat_id,
-                        content=enhanced_content,
-                        metadata={
-                            "type": "conversation_chunk",
-                            "source": source,
-                            "session_id": session_id,
-                            "chat_name": chat_name,
-                            "chunk_index": i,
-                            "message_count": chunk['message_count'],
-                            "start_time": chunk['start_time']
-                        }
-                    )
-                    vectorized_count += 1
-                    
-                    # Process in batches to avoid API rate limits
-                    if vectorized_count % batch_size == 0:
-                        print(f"🧠 Processed {vectorized_count}/{len(conversation_chunks)} chunks")
-                        await asyncio.sleep(0.1)  # Small delay to avoid rate limits
+                metadata = {
+                    "type": "conversation_chunk",
+                    "source": source,
+                    "session_id": session_id,
+                    "chat_name": chat_name,
+                    "chunk_index": i,
+                    "message_count": chunk['message_count'],
+                    "start_time": chunk['start_time'],
+                    "text_hash": chunk_hashes[i]
+                }
+                pending.append((enhanced_content, metadata))
+            
+            # One embedding call and one upsert per batch instead of a round trip each per chunk;
+            # batches are network-bound, so overlap a few of them
+            semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+            
+            async def vectorize_batch(start: int) -> int:
+                batch = pending[start:start + EMBED_BATCH_SIZE]
+                async with semaphore:
+                    try:
+                        embeddings = await self._get_embeddings_batch([content for content, _ in batch])
+                        if not embeddings:
+                            # One bad text or a transient error fails the whole request;
+                            # embed one by one so the rest of the batch is still stored
+                            embeddings = await asyncio.gather(*[
+                                self._get_embeddings(content) for content, _ in batch
+                            ])
                         
-                except Exception as e:
-                    print(f"Error vectorizing chunk {i}: {e}")
-                    continue
+                        points = [
+                            self._build_point(
+                                self._point_id(user_id, chat_id, content),
+                                user_id, chat_id, content, vector, metadata
+                            )
+                            for (content, metadata), vector in zip(batch, embeddings)
+                            if vector is not None
+                        ]
+                        if not points:
+                            return 0
+                        await self.qdrant_client.upsert(
+                            collection_name=self.collections["chat_memory"],
+                            points=points
+                        )
+                        print(f"🧠 Stored chunks {start}-{start + len(points) - 1} of {len(pending)}")
+                        return len(points)
+                        
+                    except Exception as e:
+                        print(f"Error vectorizing chunks {start}-{start + len(batch) - 1}: {e}")
+                        return 0
+            
+            vectorized_count = sum(await asyncio.gather(*[
+                vectorize_batch(start) for start in range(0, len(pending), EMBED_BATCH_SIZE)
+            ]))
             
-            print(f"🧠 Successfully vectorized {vectorized_count} conversation chunks")
+            failed_count = len(pending) - vectorized_count
+            print(f"🧠 Successfully vectorized {vectorized_count} conversation chunks ({failed_count} failed)")
             
             return {
                 "vectorized_count": vectorized_count,
+                "skipped_count": skipped_count,
+                "failed_count": failed_count,
                 "total_chunks": len(conversation_chunks),
                 "total_messages": len(all_messages)
             }
@@ -449,9 +622,7 @@ class AIService:
             # Test Qdrant
             if self.qdrant_client:
                 await self._ensure_collections_initialized()
-                collections = await asyncio.to_thread(
-                    self.qdrant_client.get_collections
-                )
+                collections = await self.qdrant_client.get_collections()
                 health["qdrant"] = True
                 health["collections"] = len(collections.collections)
         except Exception as e:
@@ -1,9 +1,8 @@
 import os
-import asyncio
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, Range, MatchValue
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Filter, FilterSelector, FieldCondition, Range, MatchValue
 
 class ContextService:
     def __init__(self):
@@ -12,7 +11,7 @@ class ContextService:
         self.qdrant_api_key = os.getenv("QDRANT_API_KEY")
         
         if self.qdrant_url and self.qdrant_api_key:
-            self.qdrant_client = QdrantClient(
+            self.qdrant_client = AsyncQdrantClient(
                 url=self.qdrant_url,
                 api_key=self.qdrant_api_key,
             )
@@ -30,22 +29,26 @@ class ContextService:
             return
             
         try:
-            # Delete points matching user_id and chat_id
-            await asyncio.to_thread(
-                self.qdrant_client.delete,
+            # Delete points matching user_id and chat_id server-side in one request;
+            # the payload indexes on user_id/chat_id keep the filter off a full scan.
+            # Wait for it to apply, or a re-vectorize could see stale hashes and skip chunks
+            await self.qdrant_client.delete(
                 collection_name=self.collection_name,
-                points_selector=Filter(
-                    must=[
-                        FieldCondition(
-                            key="user_id",
-                            match=MatchValue(value=user_id)
-                        ),
-                        FieldCondition(
-                            key="chat_id",
-                            match=MatchValue(value=str(chat_id))
-                        )
-                    ]
-                )
+                points_selector=FilterSelector(
+                    filter=Filter(
+                        must=[
+                            FieldCondition(
+                                key="user_id",
+                                match=MatchValue(value=user_id)
+                            ),
+                            FieldCondition(
+                                key="chat_id",
+                                match=MatchValue(value=str(chat_id))
+                            )
+                        ]
+                    )
+                ),
+                wait=True
             )
             print(f"Cleared memory for user {user_id}, chat {chat_id}")
             
@@ -63,17 +66,19 @@ class ContextService:
             cutoff_timestamp = cutoff_date.isoformat()
             
             # Delete old points
-            await asyncio.to_thread(
-                self.qdrant_client.delete,
+            await self.qdrant_client.delete(
                 collection_name=self.collection_name,
-                points_selector=Filter(
-                    must=[
-                        FieldCondition(
-                            key="timestamp",
-                            range=Range(lt=cutoff_timestamp)
-                        )
-                    ]
-                )
+                points_selector=FilterSelector(
+                    filter=Filter(
+                        must=[
+                            FieldCondition(
+                                key="timestamp",
+                                range=Range(lt=cutoff_timestamp)
+                            )
+                        ]
+                    )
+                ),
+                wait=True
             )
             print(f"Cleared memories older than {days} days")
             
@@ -87,8 +92,7 @@ class ContextService:
             
         try:
             # Count memories for this chat
-            results = await asyncio.to_thread(
-                self.qdrant_client.scroll,
+            results = await self.qdrant_client.scroll(
                 collection_name=self.collection_name,
                 scroll_filter=Filter(
                     must=[
@@ -145,8 +149,7 @@ class ContextService:
             
         try:
             # Get all memories for user
-            results = await asyncio.to_thread(
-                self.qdrant_client.scroll,
+            results = await self.qdrant_client.scroll(
                 collection_name=self.collection_name,
                 scroll_filter=Filter(
                     must=[
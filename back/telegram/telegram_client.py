@@ -4,15 +4,52 @@ from typing import Dict, Optional, List
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 from telethon.tl.types import Message, Dialog, User, Chat, Channel
-from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError
-import json
+from telethon.errors import SessionPasswordNeededError, PhoneCodeInvalidError, FloodWaitError, ServerError
+import orjson
 from datetime import datetime
 import time # Added for timing in get_dialogs
 
+# How long restore_session_and_get_user_info may answer from cache for a connected client
+USER_INFO_CACHE_TTL = 60
+# get_me() round-trip limit; asyncio.timeout reschedules one handle instead of wrapping a task like wait_for
+GET_ME_TIMEOUT = 10.0
+
+
+def _restore_error(e: Exception) -> dict:
+    """Результат неудачного восстановления с error_type, чтобы API отличал плохую сессию от сбоя Telegram"""
+    error = {"success": False, "error": str(e), "error_type": "invalid_session"}
+    # TimeoutError is an OSError, so check it first
+    if isinstance(e, TimeoutError):
+        error["error_type"] = "timeout"
+    elif isinstance(e, FloodWaitError):
+        error["error_type"] = "flood_wait"
+        error["retry_after"] = e.seconds
+    elif isinstance(e, (OSError, ServerError)):
+        error["error_type"] = "unavailable"
+    return error
+
+
+def _user_info_from_me(me: User) -> dict:
+    """Собрать информацию о пользователе из get_me(), display_name считается один раз"""
+    display_name = f"{me.first_name or ''} {me.last_name or ''}".strip()
+    return {
+        "success": True,
+        "id": me.id,
+        "first_name": me.first_name,
+        "last_name": me.last_name,
+        "display_name": display_name,
+        "username": me.username,
+        "phone": me.phone
+    }
+
+
 class TelegramClientManager:
     def __init__(self):
         self.active_clients: Dict[str, TelegramClient] = {}
+        self.client_last_used: Dict[str, float] = {}  # monotonic time of last use, for idle eviction
+        self.user_info_cache: Dict[str, tuple] = {}  # session_string -> (user_info, expires_at)
         self.websockets: Dict[str, List[any]] = {}  # Changed to support multiple connections per session
+        self.total_ws_count = 0  # sum of len(ws_list) over websockets, kept incrementally for health checks
         self.api_id_str = os.getenv('TELEGRAM_API_ID', '')
         self.api_hash = os.getenv('TELEGRAM_API_HASH', '')
 
@@ -34,6 +71,54 @@ class TelegramClientManager:
         client = TelegramClient(session, self.api_id, self.api_hash)
         return client
     
+    def _register_client(self, key: str, client: TelegramClient):
+        """Сохранить клиент в пуле активных"""
+        self.active_clients[key] = client
+        self.client_last_used[key] = time.monotonic()
+    
+    def _get_client(self, key: str) -> Optional[TelegramClient]:
+        """Получить активный клиент и отметить его использование"""
+        client = self.active_clients.get(key)
+        if client is not None:
+            self.client_last_used[key] = time.monotonic()
+        return client
+    
+    def _get_warm_client(self, session_string: str) -> Optional[TelegramClient]:
+        """Уже подключенный клиент для session_string (без повторного MTProto handshake)"""
+        client = self._get_client(session_string)
+        if client is not None and client.is_connected():
+            return client
+        return None
+    
+    async def evict_idle_clients(self, max_idle_seconds: float) -> int:
+        """Отключить клиенты, которые не использовались дольше max_idle_seconds"""
+        now = time.monotonic()
+        idle_keys = [
+            key for key, last_used in self.client_last_used.items()
+            if now - last_used > max_idle_seconds and key not in self.websockets
+        ]
+        for key in idle_keys:
+            client = self.active_clients.pop(key, None)
+            self.client_last_used.pop(key, None)
+            self.user_info_cache.pop(key, None)
+            if client is not None:
+                try:
+                    await client.disconnect()
+                except Exception as e:
+                    print(f"Error disconnecting idle Telegram client: {e}")
+        if idle_keys:
+            print(f"🧹 [TELEGRAM] Evicted {len(idle_keys)} idle clients, active: {len(self.active_clients)}")
+        return len(idle_keys)
+    
+    async def run_idle_eviction(self, interval_seconds: float = 300, max_idle_seconds: float = 1800):
+        """Фоновая задача: периодически отключать неиспользуемые клиенты"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.evict_idle_clients(max_idle_seconds)
+            except Exception as e:
+                print(f"Error during Telegram client eviction: {e}")
+    
     async def authenticate_with_phone(self, phone: str, session_id: str) -> dict:
         """Начать процесс аутентификации по номеру телефона"""
         try:
@@ -54,7 +139,7 @@ class TelegramClientManager:
             print(f"🔐 [TELEGRAM] Code request successful! Hash: {code_request.phone_code_hash[:10]}...")
             
             # Сохранить клиент временно
-            self.active_clients[f"temp_{session_id}"] = client
+            self._register_client(f"temp_{session_id}", client)
             print(f"🔐 [TELEGRAM] Client saved temporarily for session: {session_id}")
             
             return {
@@ -75,7 +160,7 @@ class TelegramClientManager:
     async def verify_phone_code(self, phone: str, code: str, phone_code_hash: str, session_id: str) -> dict:
         """Проверить код подтверждения"""
         try:
-            client = self.active_clients.get(f"temp_{session_id}")
+            client = self._get_client(f"temp_{session_id}")
             if not client:
                 return {"success": False, "error": "Сессия не найдена"}
             
@@ -87,8 +172,9 @@ class TelegramClientManager:
                 session_string = client.session.save()
                 
                 # Переместить клиент в активные под session_string (не UUID!)
-                self.active_clients[session_string] = client
+                self._register_client(session_string, client)
                 del self.active_clients[f"temp_{session_id}"]
+                self.client_last_used.pop(f"temp_{session_id}", None)
                 
                 # Настроить обработчики событий
                 await self._setup_event_handlers(client, session_string)
@@ -116,7 +202,7 @@ class TelegramClientManager:
         try:
             print(f"🔐 [TELEGRAM] Verifying 2FA password for session: {session_id}")
             
-            client = self.active_clients.get(f"temp_{session_id}")
+            client = self._get_client(f"temp_{session_id}")
             if not client:
                 print(f"❌ [TELEGRAM] Temp session not found: temp_{session_id}")
                 return {"success": False, "error": "Сессия не найдена"}
@@ -130,8 +216,9 @@ class TelegramClientManager:
             print(f"🔐 [TELEGRAM] Session string generated successfully")
             
             # Переместить клиент в активные под session_string (не UUID!)
-            self.active_clients[session_string] = client
+            self._register_client(session_string, client)
             del self.active_clients[f"temp_{session_id}"]
+            self.client_last_used.pop(f"temp_{session_id}", None)
             print(f"🔐 [TELEGRAM] Client moved to active sessions under session_string")
             
             # Настроить обработчики событий
@@ -156,12 +243,19 @@ class TelegramClientManager:
             print(f"🔄 [TELEGRAM] Restoring session for session_id: {session_id}")
             print(f"🔄 [TELEGRAM] Session string length: {len(session_string)}")
             
+            if self._get_warm_client(session_string) is not None:
+                print(f"♻️ [TELEGRAM] Reusing connected client for session")
+                return {
+                    "success": True,
+                    "message": "Сессия восстановлена"
+                }
+            
             client = await self.create_client(session_string)
             await client.connect()
             
             if await client.is_user_authorized():
                 # Сохраняем клиент под session_string для последующих API вызовов
-                self.active_clients[session_string] = client
+                self._register_client(session_string, client)
                 await self._setup_event_handlers(client, session_string)
                 
                 print(f"✅ [TELEGRAM] Session restored and client saved under session_string")
@@ -181,13 +275,60 @@ class TelegramClientManager:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    async def restore_session_and_get_user_info(self, session_string: str, session_id: str) -> dict:
+        """Восстановить сессию и сразу получить информацию о пользователе (один get_me вместо двух запросов)"""
+        try:
+            print(f"🔄 [TELEGRAM] Restoring session with user info for session_id: {session_id}")
+            
+            client = self._get_warm_client(session_string)
+            is_new_client = client is None
+            if not is_new_client:
+                # Повторный /connect или /restore-session (перезагрузка страницы) без get_me()
+                cached = self.user_info_cache.get(session_string)
+                if cached and cached[1] > time.monotonic():
+                    return cached[0]
+            else:
+                client = await self.create_client(session_string)
+                await client.connect()
+            
+            try:
+                # get_me() returns None for unauthorized sessions, so it doubles as the auth check
+                async with asyncio.timeout(GET_ME_TIMEOUT):
+                    me = await client.get_me()
+            except asyncio.TimeoutError:
+                print(f"⏰ [TELEGRAM] get_me() timed out")
+                if is_new_client:
+                    await client.disconnect()
+                return {"success": False, "error": "Timeout при получении информации о пользователе", "error_type": "timeout"}
+            
+            if not me:
+                print(f"❌ [TELEGRAM] Session is not authorized")
+                if is_new_client:
+                    await client.disconnect()
+                else:
+                    await self.disconnect_client(session_string)
+                return {"success": False, "error": "Сессия недействительна", "error_type": "invalid_session"}
+            
+            if is_new_client:
+                # Сохраняем клиент под session_string для последующих API вызовов
+                self._register_client(session_string, client)
+                await self._setup_event_handlers(client, session_string)
+            print(f"✅ [TELEGRAM] Session restored, active clients count: {len(self.active_clients)}")
+            
+            user_info = _user_info_from_me(me)
+            self.user_info_cache[session_string] = (user_info, time.monotonic() + USER_INFO_CACHE_TTL)
+            return user_info
+            
+        except Exception as e:
+            return _restore_error(e)
+    
     async def get_dialogs(self, session_id: str, limit: int = 50, include_archived: bool = False, include_readonly: bool = True, include_groups: bool = True) -> dict:
         """Получить список диалогов"""
         try:
             print(f"📋 [TELEGRAM] get_dialogs called with session_id: {session_id[:50]}...")
             print(f"📋 [TELEGRAM] Active clients count: {len(self.active_clients)}")
             
-            client = self.active_clients.get(session_id)
+            client = self._get_client(session_id)
             if not client:
                 print(f"❌ [TELEGRAM] Client not found for session_id: {session_id[:50]}...")
                 return {"success": False, "error": "Клиент не найден"}
@@ -275,7 +416,7 @@ class TelegramClientManager:
             print(f"💬 [TELEGRAM] get_messages called: dialog_id={dialog_id}, limit={limit}, offset_id={offset_id}")
             start_time = time.time()
             
-            client = self.active_clients.get(session_id)
+            client = self._get_client(session_id)
             if not client:
                 return {"success": False, "error": "Клиент не найден"}
             
@@ -320,7 +461,7 @@ class TelegramClientManager:
     async def send_message(self, session_id: str, dialog_id: int, text: str) -> dict:
         """Отправить сообщение"""
         try:
-            client = self.active_clients.get(session_id)
+            client = self._get_client(session_id)
             if not client:
                 return {"success": False, "error": "Клиент не найден"}
             
@@ -328,7 +469,6 @@ class TelegramClientManager:
             
             # Manually broadcast the sent message via WebSocket
             if session_id in self.websockets:
-                websockets_list = self.websockets[session_id]
                 message_data = {
                     "type": "new_message",
                     "data": {
@@ -341,21 +481,9 @@ class TelegramClientManager:
                     }
                 }
                 
-                # Send to all connected websockets for this session
-                broken_connections = []
-                for i, websocket in enumerate(websockets_list):
-                    try:
-                        await websocket.send_text(json.dumps(message_data))
-                    except Exception as e:
-                        print(f"Error sending outgoing message websocket notification to session {session_id}, connection {i}: {e}")
-                        broken_connections.append(websocket)
-                
-                # Remove broken connections
-                for broken_ws in broken_connections:
-                    await self.remove_websocket_connection(session_id, broken_ws)
-                
-                if websockets_list:  # Only log if there are still active connections
-                    print(f"Sent outgoing message notification to {len(websockets_list)} connections for session {session_id}: {text[:50]}...")
+                sent = await self._broadcast(session_id, message_data)
+                if sent:  # Only log if there are still active connections
+                    print(f"Sent outgoing message notification to {sent} connections for session {session_id}: {text[:50]}...")
             
             return {
                 "success": True,
@@ -374,7 +502,6 @@ class TelegramClientManager:
         @client.on(events.NewMessage)
         async def new_message_handler(event):
             if session_id in self.websockets:
-                websockets_list = self.websockets[session_id]
                 message_data = {
                     "type": "new_message",
                     "data": {
@@ -387,27 +514,39 @@ class TelegramClientManager:
                     }
                 }
                 
-                # Send to all connected websockets for this session
-                broken_connections = []
-                for i, websocket in enumerate(websockets_list):
-                    try:
-                        await websocket.send_text(json.dumps(message_data))
-                    except Exception as e:
-                        print(f"Error sending websocket message to session {session_id}, connection {i}: {e}")
-                        broken_connections.append(websocket)
-                
-                # Remove broken connections
-                for broken_ws in broken_connections:
-                    await self.remove_websocket_connection(session_id, broken_ws)
-                
-                if websockets_list:  # Only log if there are still active connections
-                    print(f"Sent new message notification to {len(websockets_list)} connections for session {session_id}: {event.message.message[:50] if event.message.message else 'No text'}...")
+                sent = await self._broadcast(session_id, message_data)
+                if sent:  # Only log if there are still active connections
+                    print(f"Sent new message notification to {sent} connections for session {session_id}: {event.message.message[:50] if event.message.message else 'No text'}...")
+    
+    async def _broadcast(self, session_id: str, message_data: dict) -> int:
+        """Отправить сообщение во все WebSocket соединения сессии, вернуть число успешных отправок"""
+        websockets_list = list(self.websockets.get(session_id, ()))
+        if not websockets_list:
+            return 0
+        
+        # Serialize once and send to all connections concurrently (text frames: the client JSON.parses them)
+        frame = orjson.dumps(message_data).decode()
+        results = await asyncio.gather(
+            *(websocket.send_text(frame) for websocket in websockets_list),
+            return_exceptions=True
+        )
+        
+        # Remove broken connections
+        sent = 0
+        for i, (websocket, result) in enumerate(zip(websockets_list, results)):
+            if isinstance(result, Exception):
+                print(f"Error sending websocket message to session {session_id}, connection {i}: {result}")
+                await self.remove_websocket_connection(session_id, websocket)
+            else:
+                sent += 1
+        return sent
     
     async def add_websocket(self, session_id: str, websocket):
         """Добавить WebSocket соединение"""
         if session_id not in self.websockets:
             self.websockets[session_id] = []
         self.websockets[session_id].append(websocket)
+        self.total_ws_count += 1
         print(f"Added WebSocket connection for session {session_id}. Total connections: {len(self.websockets[session_id])}")
 
     async def remove_websocket_connection(self, session_id: str, websocket):
@@ -415,6 +554,7 @@ class TelegramClientManager:
         if session_id in self.websockets:
             try:
                 self.websockets[session_id].remove(websocket)
+                self.total_ws_count -= 1
                 print(f"Removed WebSocket connection for session {session_id}. Remaining connections: {len(self.websockets[session_id])}")
                 
                 # If no more connections, remove the session entirely
@@ -427,7 +567,7 @@ class TelegramClientManager:
     async def remove_websocket(self, session_id: str):
         """Удалить все WebSocket соединения для сессии"""
         if session_id in self.websockets:
-            del self.websockets[session_id]
+            self.total_ws_count -= len(self.websockets.pop(session_id))
             print(f"Removed all WebSocket connections for session {session_id}")
     
     async def get_user_info(self, session_id: str) -> dict:
@@ -436,7 +576,7 @@ class TelegramClientManager:
             print(f"👤 [TELEGRAM] Getting user info for session: {session_id[:50]}...")
             print(f"👤 [TELEGRAM] Active clients count: {len(self.active_clients)}")
             
-            client = self.active_clients.get(session_id)
+            client = self._get_client(session_id)
             if not client:
                 print(f"❌ [TELEGRAM] Client not found for session: {session_id[:50]}...")
                 return {"success": False, "error": "Клиент не найден"}
@@ -445,11 +585,12 @@ class TelegramClientManager:
             
             # Add timeout to prevent hanging
             try:
-                me = await asyncio.wait_for(client.get_me(), timeout=10.0)
+                async with asyncio.timeout(GET_ME_TIMEOUT):
+                    me = await client.get_me()
                 print(f"✅ [TELEGRAM] User info retrieved successfully")
             except asyncio.TimeoutError:
                 print(f"⏰ [TELEGRAM] get_me() timed out")
-                return {"success": False, "error": "Timeout при получении информации о пользователе"}
+                return {"success": False, "error": "Timeout при получении информации о пользователе", "error_type": "timeout"}
             except Exception as e:
                 print(f"❌ [TELEGRAM] get_me() failed: {e}")
                 return {"success": False, "error": f"Ошибка получения данных: {str(e)}"}
@@ -462,14 +603,7 @@ class TelegramClientManager:
             print(me.to_json(indent=4))
             print("--------------------------")
 
-            return {
-                "success": True,
-                "id": me.id,
-                "first_name": me.first_name,
-                "last_name": me.last_name,
-                "username": me.username,
-                "phone": me.phone
-            }
+            return _user_info_from_me(me)
 
         except Exception as e:
             print(f"Error in get_user_info: {e}")
@@ -481,5 +615,15 @@ class TelegramClientManager:
             client = self.active_clients[session_id]
             await client.disconnect()
             del self.active_clients[session_id]
+            self.client_last_used.pop(session_id, None)
+            self.user_info_cache.pop(session_id, None)
         
-        await self.remove_websocket(session_id)
\ No newline at end of file
+        await self.remove_websocket(session_id)
+    
+    async def disconnect_all(self):
+        """Отключить все клиенты (при остановке приложения)"""
+        clients = list(self.active_clients.values())
+        self.active_clients.clear()
+        self.client_last_used.clear()
+        self.user_info_cache.clear()
+        await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
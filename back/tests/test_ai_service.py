@@ -0,0 +1,91 @@
+"""
+Tests for chat history vectorization in services.ai_service, against an in-memory Qdrant
+Run from the repository root: python -m pytest back/tests/test_ai_service.py
+"""
+
+import asyncio
+
+import pytest
+from qdrant_client import AsyncQdrantClient
+
+import back.services.ai_service as ai_service
+
+
+class WhitespaceTokenizer:
+    """Stands in for tiktoken, which downloads its encoding on first use"""
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture
+def embed_calls(monkeypatch):
+    """Record every embed_content call and answer with a fixed-size vector per text"""
+    calls = []
+
+    def embed_content(model, content):
+        calls.append(content)
+        if isinstance(content, list):
+            return {"embedding": [[0.1] * 768 for _ in content]}
+        return {"embedding": [0.1] * 768}
+
+    monkeypatch.setattr(ai_service.genai, "embed_content", embed_content)
+    monkeypatch.setattr(ai_service, "_get_tokenizer", lambda: WhitespaceTokenizer())
+    ai_service._count_tokens.cache_clear()
+    ai_service._embedding_cache.clear()
+    return calls
+
+
+def make_service():
+    service = ai_service.AIService.__new__(ai_service.AIService)
+    service.vector_enabled = True
+    service._collections_initialized = False
+    service.qdrant_client = AsyncQdrantClient(":memory:")
+    service.collections = {"chat_memory": "chat_memory", "user_context": "user_context"}
+    return service
+
+
+def make_messages(count):
+    return [
+        {"sender": "neo", "text": f"message number {i} " * 20, "timestamp": f"2026-01-01T00:{i % 60:02d}"}
+        for i in range(count)
+    ]
+
+
+def vectorize(service, messages):
+    return service.vectorize_chat_history("user-1", "session-1", "chat-1", "whatsapp", "Chat", messages)
+
+
+def test_vectorize_skips_stored_chunks(embed_calls):
+    async def body():
+        service = make_service()
+        first = await vectorize(service, make_messages(200))
+        assert first["skipped_count"] == 0
+        assert first["vectorized_count"] == first["total_chunks"] > 0
+
+        ai_service._embedding_cache.clear()
+        embed_calls.clear()
+        second = await vectorize(service, make_messages(200))
+        assert second["skipped_count"] == second["total_chunks"]
+        assert second["vectorized_count"] == 0
+        assert embed_calls == []
+
+        count = await service.qdrant_client.count("chat_memory")
+        assert count.count == first["vectorized_count"]
+    asyncio.run(body())
+
+
+def test_vectorize_embeds_one_by_one_when_batch_fails(monkeypatch, embed_calls):
+    def embed_content(model, content):
+        if isinstance(content, list):
+            raise RuntimeError("batch rejected")
+        if "message number 7 " in content:
+            raise RuntimeError("bad text")
+        return {"embedding": [0.1] * 768}
+
+    monkeypatch.setattr(ai_service.genai, "embed_content", embed_content)
+
+    async def body():
+        result = await vectorize(make_service(), make_messages(200))
+        assert result["failed_count"] == 1
+        assert result["vectorized_count"] == result["total_chunks"] - 1
+    asyncio.run(body())
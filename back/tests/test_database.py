@@ -0,0 +1,143 @@
+"""
+Tests for the async database helpers against an in-memory SQLite database
+Run from the repository root: python -m pytest back/tests/test_database.py
+"""
+
+import asyncio
+from uuid import UUID
+
+import pytest
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, selectinload
+
+from back.models.database import (
+    Base, PlatformSession, bulk_create_users_async, create_user, create_user_async, get_user_by_email,
+    get_user_by_email_or_username, get_user_by_id, get_user_by_id_async, get_user_by_username,
+    get_user_by_username_async, update_user_last_login, upsert_platform_session_async
+)
+
+
+def record_statements(engine):
+    """Collect the SQL of every statement the (sync) engine sends"""
+    statements = []
+    event.listen(
+        engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement)
+    )
+    return statements
+
+
+def run_with_session(test):
+    """Run an async test body with a fresh SQLite schema and a session on it"""
+    async def runner():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        statements = record_statements(engine.sync_engine)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                await test(db, statements)
+        finally:
+            await engine.dispose()
+    asyncio.run(runner())
+
+
+def user_data(username="neo", email="neo@example.com"):
+    return {"username": username, "email": email, "hashed_password": "x"}
+
+
+def test_get_user_by_id_uses_identity_map():
+    async def body(db, statements):
+        user = await create_user_async(db, user_data())
+        user_id = UUID(user.id)
+        db.expunge_all()
+
+        statements.clear()
+        first = await get_user_by_id_async(db, user_id)
+        assert first is not None and first.username == "neo"
+        assert len(statements) == 1
+
+        statements.clear()
+        second = await get_user_by_id_async(db, user_id)
+        assert second is first
+        assert statements == []
+    run_with_session(body)
+
+
+def test_bulk_create_users_normalises_like_create_user():
+    async def body(db, statements):
+        users = [user_data(f"User{i}", f"user{i}@example.com") for i in range(5)]
+        user_ids = await bulk_create_users_async(db, users, batch_size=2)
+        assert len(user_ids) == 5
+
+        for user_id in user_ids:
+            user = await get_user_by_id_async(db, UUID(user_id))
+            assert user.username == user.username.lower()
+            assert user.language_preference == "en"
+            assert user.theme_preference == "cyberpunk"
+            assert user.is_active is True
+            assert user.created_at is not None and user.updated_at is not None
+        assert await get_user_by_username_async(db, "USER3") is not None
+    run_with_session(body)
+
+
+def test_upsert_platform_session_updates_in_place():
+    async def body(db, statements):
+        user = await create_user_async(db, user_data())
+        await upsert_platform_session_async(db, user.id, "telegram", "first")
+        await upsert_platform_session_async(db, user.id, "whatsapp", "other")
+        await upsert_platform_session_async(db, user.id, "telegram", "second")
+
+        result = await db.execute(
+            select(PlatformSession.platform, PlatformSession.session_string)
+            .where(PlatformSession.user_id == user.id)
+            .order_by(PlatformSession.platform)
+        )
+        assert result.all() == [("telegram", "second"), ("whatsapp", "other")]
+    run_with_session(body)
+
+
+def test_sync_user_helpers_issue_one_statement_each():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    statements = record_statements(engine)
+    with Session(engine, expire_on_commit=False) as db:
+        user = create_user(db, user_data())
+        lookups = [
+            lambda: get_user_by_email(db, "neo@example.com"),
+            lambda: get_user_by_username(db, "NEO"),
+            lambda: get_user_by_id(db, user.id),
+            lambda: get_user_by_email_or_username(db, "neo@example.com"),
+            lambda: get_user_by_email_or_username(db, "neo"),
+        ]
+        for lookup in lookups:
+            statements.clear()
+            assert lookup() is user
+            assert len(statements) == 1 and statements[0].startswith("SELECT")
+
+        statements.clear()
+        update_user_last_login(db, user.id)
+        assert len(statements) == 1 and statements[0].startswith("UPDATE")
+    engine.dispose()
+
+
+def test_platform_session_user_needs_an_explicit_loader():
+    async def body(db, statements):
+        user = await create_user_async(db, user_data())
+        await upsert_platform_session_async(db, user.id, "telegram", "session")
+        db.expunge_all()
+
+        platform_session = (await db.execute(select(PlatformSession))).scalar_one()
+        statements.clear()
+        with pytest.raises(InvalidRequestError):
+            platform_session.user
+        assert statements == []
+
+        db.expunge_all()
+        platform_session = (
+            await db.execute(select(PlatformSession).options(selectinload(PlatformSession.user)))
+        ).scalar_one()
+        assert platform_session.user.username == "neo"
+    run_with_session(body)
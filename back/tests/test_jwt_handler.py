@@ -0,0 +1,72 @@
+"""
+Tests for the hand-rolled HS256 encoder in auth.jwt_handler
+Run from the repository root: python -m pytest back/tests/test_jwt_handler.py
+"""
+
+import time
+from types import SimpleNamespace
+from uuid import uuid4
+
+from jose import jwt
+
+from back.auth import jwt_handler
+from back.auth.jwt_handler import ALGORITHM, SECRET_KEY, TokenHandler, _decode_cached, _encode_jwt
+
+
+def test_encode_matches_jose():
+    claims = {"user_id": str(uuid4()), "username": "neo", "exp": int(time.time()) + 60, "type": "access"}
+    token = _encode_jwt(claims)
+    assert token == jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+    assert jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]) == claims
+
+
+def test_created_tokens_round_trip():
+    user_id = uuid4()
+    tokens = TokenHandler.create_token_pair({"user_id": str(user_id), "username": "neo"})
+
+    info = TokenHandler.verify_and_extract(tokens["access_token"])
+    assert info.user_id == user_id
+    assert info.type == "access"
+    assert TokenHandler.get_token_type(tokens["refresh_token"]) == "refresh"
+
+
+def test_token_without_exp_is_rejected():
+    token = _encode_jwt({"user_id": str(uuid4()), "type": "access"})
+    assert TokenHandler.decode_token(token) is None
+    assert TokenHandler.verify_and_extract(token) is None
+
+
+def test_expired_token_is_rejected():
+    token = _encode_jwt({"user_id": str(uuid4()), "type": "access", "exp": int(time.time()) - 1})
+    assert TokenHandler.decode_token(token) is None
+
+
+def test_tampered_token_is_rejected():
+    token = TokenHandler.create_access_token({"user_id": str(uuid4())})
+    header, _, signature = token.split(".")
+    forged = _encode_jwt({"user_id": str(uuid4()), "exp": int(time.time()) + 60, "type": "access"})
+    assert TokenHandler.decode_token(f"{header}.{forged.split('.')[1]}.{signature}") is None
+
+
+def test_repeat_decode_is_served_from_cache():
+    token = TokenHandler.create_access_token({"user_id": str(uuid4())})
+    misses = _decode_cached.cache_info().misses
+
+    first = TokenHandler.decode_token(token)
+    second = TokenHandler.decode_token(token)
+    assert first == second
+    assert _decode_cached.cache_info().misses == misses + 1
+    # Callers get their own copy, so mutating one can't poison the cached payload
+    first["user_id"] = "changed"
+    assert TokenHandler.decode_token(token) == second
+
+
+def test_cached_payload_is_rejected_once_expired(monkeypatch):
+    token = TokenHandler.create_access_token({"user_id": str(uuid4())})
+    payload = TokenHandler.decode_token(token)
+    assert payload is not None
+
+    monkeypatch.setattr(jwt_handler, "time", SimpleNamespace(time=lambda: payload["exp"] + 1))
+    hits = _decode_cached.cache_info().hits
+    assert TokenHandler.decode_token(token) is None
+    assert _decode_cached.cache_info().hits == hits + 1
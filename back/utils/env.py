@@ -0,0 +1,12 @@
+"""
+Environment loading shared by modules that read settings at import time
+"""
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=None)
+def load_env() -> bool:
+    """Parse .env once per process; later calls are no-ops"""
+    return load_dotenv()
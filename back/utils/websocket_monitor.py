@@ -3,14 +3,19 @@ WebSocket monitoring utilities for debugging real-time connections
 """
 import asyncio
 import json
+import time
 from datetime import datetime
 from typing import Dict, Any
 
+STATS_CACHE_TTL = 1
+
+
 class WebSocketMonitor:
     def __init__(self):
         self.connection_stats = {}
         self.message_count = 0
         self.start_time = datetime.now()
+        self._stats_cache = None  # (stats, expires_at), so frequent health probes don't re-aggregate
     
     def log_connection(self, session_id: str, event: str, details: str = ""):
         """Log WebSocket connection events"""
@@ -39,10 +44,14 @@ class WebSocketMonitor:
         self.log_connection(session_id, f"MESSAGE_SENT_{status}", f"Type: {message_type}")
     
     def get_stats(self) -> Dict[str, Any]:
-        """Get current monitoring statistics"""
+        """Get current monitoring statistics (cached for STATS_CACHE_TTL seconds)"""
+        now = time.monotonic()
+        if self._stats_cache and self._stats_cache[1] > now:
+            return self._stats_cache[0]
+        
         uptime = (datetime.now() - self.start_time).total_seconds()
         
-        return {
+        stats = {
             "uptime_seconds": uptime,
             "total_messages_sent": self.message_count,
             "active_connections": len([
@@ -51,6 +60,8 @@ class WebSocketMonitor:
             ]),
             "connection_details": self.connection_stats
         }
+        self._stats_cache = (stats, now + STATS_CACHE_TTL)
+        return stats
     
     def cleanup_session(self, session_id: str):
         """Clean up monitoring data for a session"""
@@ -1,5 +1,5 @@
 import asyncio
-import json
+import orjson
 import os
 from typing import Dict, Optional, List, Any
 from datetime import datetime
@@ -139,23 +139,28 @@ class WhatsAppClientManager:
     async def broadcast_to_websockets(self, session_id: str, event_type: str, data: Any):
         """Broadcast an event to all WebSocket connections for a session"""
         if session_id in self.websockets:
-            message = json.dumps({
+            # Serialize once and fan the same frame out to every socket
+            message = orjson.dumps({
                 "type": event_type,
                 "data": data,
                 "source": "whatsapp"
-            })
+            }, option=orjson.OPT_NON_STR_KEYS).decode()
             
-            # Send to all websockets and remove disconnected ones
-            active_websockets = []
-            for websocket in self.websockets[session_id]:
-                try:
-                    await websocket.send_text(message)
-                    active_websockets.append(websocket)
-                except Exception:
-                    # WebSocket is disconnected, skip it
-                    continue
+            # Send to all websockets concurrently so one slow client doesn't hold up the rest
+            websockets = list(self.websockets[session_id])
+            results = await asyncio.gather(
+                *(websocket.send_text(message) for websocket in websockets),
+                return_exceptions=True
+            )
             
-            self.websockets[session_id] = active_websockets
+            # Remove disconnected ones (the list may have changed while sending)
+            failed = [ws for ws, result in zip(websockets, results) if isinstance(result, Exception)]
+            if failed and session_id in self.websockets:
+                remaining = [ws for ws in self.websockets[session_id] if ws not in failed]
+                if remaining:
+                    self.websockets[session_id] = remaining
+                else:
+                    del self.websockets[session_id]
     
     def is_session_active(self, session_id: str) -> bool:
         """Check if a session is active"""